@@ -3,63 +3,1047 @@ import numpy as np
 import re
 import json
 import sys
-import plotly.express as px
-import cx_Oracle
 import os
+import hashlib
+import shutil
+import argparse
+import threading
+import sqlite3
+import time
+import resource
+import cProfile
+import fcntl
+import importlib.util
+import zipfile
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+
+INPUT_DIR = os.getenv(
+    "RECON_INPUT_DIR",
+    "/home/savyasachi/Downloads/Automation_Store_Sale_Reconciliation",
+)
+MASTER_FILE_PATH = os.path.join(INPUT_DIR, "MASTER FILE FOR COLLECTION_VOL-2.xlsb")
+MASTER_CACHE_DIR = os.path.join(INPUT_DIR, ".master_cache")
+WORKBOOK_CACHE_DIR = os.path.join(INPUT_DIR, ".workbook_cache")
+SBI_CSV_PATH = os.path.join(INPUT_DIR, "SBI CC.csv")
+PAYTM_CSV_PATH = os.path.join(INPUT_DIR, "Paytm_EDC.csv")
+BAJAJ_LEDGER_PATH = os.path.join(INPUT_DIR, "Common_Ledger (26).xlsx")
+BAJAJ_LEDGER_PATTERN = re.compile(r"Common_Ledger \((\d+)\)\.xlsx")
+# Each run writes under OUTPUT_DIR/<from>_<to>/ so runs for different dates
+# never touch each other's files.
+OUTPUT_DIR = os.getenv("RECON_OUTPUT_DIR", os.path.join(INPUT_DIR, "output"))
+OUTPUT_NAME = "merged_data_final"
+GRAPH_HTML_NAME = "difference_bar_plot.html"
+# Every run's per-store differences are also kept here, one Parquet file per
+# day, for difference_trends().
+HISTORY_DIR = os.path.join(OUTPUT_DIR, "history")
+TRENDS_NAME = "difference_trends"
+HISTORY_WINDOW_DAYS = 7
+ANOMALY_Z_SCORE = 3.0
+CUBE_DB_PATH = os.path.join(INPUT_DIR, "reconciliation_cube.sqlite")
+# Every acquirer transaction seen so far, by source, for dedupe_transactions().
+TRANSACTION_INDEX_PATH = os.path.join(INPUT_DIR, "transaction_index.sqlite")
+# Fetcher results keyed on input content; least recently used entries are
+# dropped past RECON_FETCH_CACHE_MB, and 0 turns the cache off.
+FETCH_CACHE_DIR = os.path.join(INPUT_DIR, ".fetch_cache")
+FETCH_CACHE_MAX_BYTES = int(os.getenv("RECON_FETCH_CACHE_MB", "256")) * 1024 * 1024
+
+DEFAULT_BUSINESS_DATE = "2023-12-28"
+
+# Opt-in per-stage profiling: RECON_PROFILE=cprofile|pyinstrument, optionally
+# limited to RECON_PROFILE_STAGES="SBI,merge Paytm".
+PROFILE_MODE = os.getenv("RECON_PROFILE")
+PROFILE_STAGES = {
+    name.strip() for name in os.getenv("RECON_PROFILE_STAGES", "").split(",") if name.strip()
+}
+PROFILE_DIR = os.getenv("RECON_PROFILE_DIR", os.path.join(INPUT_DIR, "profiles"))
+CSV_CHUNK_ROWS = 250_000
+PAYTM_TIME_FORMAT = "%d-%m-%Y %H:%M:%S"
+
+# "polars" runs the raw file scans of the sources in ENGINE_SOURCES as lazy
+# Polars queries; everything downstream of the per-day totals stays on pandas.
+ENGINES = ["pandas", "polars"]
+ENGINE = os.getenv("RECON_ENGINE", "pandas")
+
+WATCH_POLL_SECONDS = 2
+# Open Oracle days change all day; the watcher re-queries them this often.
+WATCH_DB_REFRESH_SECONDS = int(os.getenv("RECON_WATCH_DB_SECONDS", "300"))
+
+# Thousands-grouped numbers are tried first so "1,234.50" is one amount while
+# "100.00,20.00" is two. A leading minus is kept, so refund rows ("-100.00")
+# reduce the totals; the old Paytm regex read them as +100.
+PLAIN_AMOUNT_PATTERN = r"-?\d+(?:\.\d+)?"
+AMOUNT_PATTERN = r"(-?\d{1,3}(?:,\d{3})+(?:\.\d+)?|-?\d+(?:\.\d+)?)"
+
+# Lookup sheets used by the fetchers, parsed from the master workbook in one pass.
+MASTER_SHEETS = {
+    "sbi_tid": {"sheet_name": 11, "usecols": ["TID", "LOCATION NAME"]},
+    "hdfc_tid": {"sheet_name": 4, "usecols": ["HDFC TID", "Store Locations"]},
+    "bfl_dealer": {
+        "sheet_name": 14,
+        "usecols": ["BFL\nDEALER CODE", "Store name"],
+    },
+    "paytm_mid": {
+        "sheet_name": 3,
+        "header": 1,
+        "usecols": ["Production Mid", "LOCATION"],
+    },
+}
+# Join keys of the lookup sheets; the store name columns keep their spelling
+# for the store dimension.
+MASTER_KEY_COLUMNS = {"TID", "HDFC TID", "BFL\nDEALER CODE", "Production Mid"}
+# Bump when _parse_master_workbook() changes so cached sheets are re-parsed.
+MASTER_CACHE_VERSION = 2
+
+WORKBOOK_FORMATS = {"xlsx", "xlsb", "xls"}
+ZIP_MAGIC = b"PK\x03\x04"
+OLE2_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+# Readers per sniffed format when python-calamine (which reads all three) is
+# not installed.
+EXCEL_ENGINES = {"xlsx": "openpyxl", "xlsb": "pyxlsb", "xls": "xlrd"}
+HAS_CALAMINE = importlib.util.find_spec("python_calamine") is not None
+
+HDFC_COLUMNS = ["TERMINAL NUMBER", "DOMESTIC AMT", "INTNL AMT"]
+BAJAJ_COLUMNS = ["Supplier ID", "Invoice Date", "Invoice Amt"]
+NEW_MOP_COLUMNS = ["Ledger", "Entry type long", "Source Short Name", "Balance SUM"]
+# Rows of each input read by the preflight to check dates and encodings.
+PREFLIGHT_ROWS = 50
+
+ORACLE_POOL_MAX_SESSIONS = 4
+ORACLE_FETCH_ARRAYSIZE = 5000
+# Ginesys extractions run one BILLDATE window of this many days per query, and
+# every closed window is checkpointed so an interrupted pull resumes from it.
+# Windows are counted from a fixed Monday, so 7-day windows are calendar weeks.
+GINESYS_CHUNK_DAYS = int(os.getenv("GINESYS_CHUNK_DAYS", "7"))
+GINESYS_CHUNK_EPOCH = "2000-01-03"
+GINESYS_CHECKPOINT_DIR = os.path.join(INPUT_DIR, ".ginesys_checkpoints")
+# Checkpoints of pulls that were never resumed are dropped after this long.
+GINESYS_CHECKPOINT_MAX_AGE_DAYS = 7
+
+# A SQLite file with PSITE_POSBILLMOP/ADMSITE tables can stand in for Ginesys,
+# e.g. for benchmark_reconciliation.py. The DB link only exists on Oracle.
+GINESYS_SQLITE_PATH = os.getenv("GINESYS_SQLITE_PATH")
+GINESYS_DB_LINK = "" if GINESYS_SQLITE_PATH else "@hitesh_tovmrl"
+
+# Site join and per-store totals run on the remote side of the DB link so only
+# one row per store and day crosses it. The text is constant so the server can
+# reuse the parsed cursor across dates.
+GINESYS_ADVANCE_SQL = f"""
+    SELECT /*+ DRIVING_SITE(m) */
+           s.SHRTNAME AS STORE,
+           TRUNC(m.BILLDATE) AS BILL_DAY,
+           m.MOPDESC,
+           SUM(m.BASEAMT) AS TOTAL_BASEAMT,
+           MAX(m.BILLDATE) AS MAX_BILLDATE,
+           COUNT(*) AS BILL_ROWS
+    FROM PSITE_POSBILLMOP{GINESYS_DB_LINK} m
+    JOIN ADMSITE{GINESYS_DB_LINK} s ON s.CODE = m.ADMSITE_CODE
+    WHERE m.MOPDESC IN ('Credit Card', 'Paytm_EDC_1')
+    AND m.BILLDATE >= :start_date
+    AND m.BILLDATE < :end_date
+    GROUP BY s.SHRTNAME, TRUNC(m.BILLDATE), m.MOPDESC
+"""
+
+# Line-level counterpart of GINESYS_ADVANCE_SQL for the transaction matcher.
+# ROWID identifies a bill MOP row both on Oracle and on the SQLite stand-in.
+GINESYS_POS_LINES_SQL = f"""
+    SELECT /*+ DRIVING_SITE(m) */
+           m.ROWID AS BILL_REF,
+           s.SHRTNAME AS STORE,
+           m.MOPDESC,
+           m.BILLDATE,
+           m.BASEAMT
+    FROM PSITE_POSBILLMOP{GINESYS_DB_LINK} m
+    JOIN ADMSITE{GINESYS_DB_LINK} s ON s.CODE = m.ADMSITE_CODE
+    WHERE m.MOPDESC IN ('Credit Card', 'Paytm_EDC_1')
+    AND m.BILLDATE >= :start_date
+    AND m.BILLDATE < :end_date
+"""
+
+MATCH_TOLERANCE_MINUTES = 30
+MATCH_ROUNDS = 5
+
+# POS mode of payment each acquirer's transactions are booked under.
+ACQUIRER_MOPS = {
+    "SBI": "Credit Card",
+    "HDFC": "Credit Card",
+    "Bajaj": "Credit Card",
+    "Paytm": "Paytm_EDC_1",
+}
+# HDFC and Bajaj only carry the business day, not the transaction time.
+TIMESTAMPED_SOURCES = {"SBI", "Paytm"}
+# Acquirer reference (RRN) headers, in order of preference. Repeated rows are
+# only taken out of the totals when the export carries one of them.
+TRANSACTION_REFERENCES = {
+    "SBI": ["Ref No", "RRN"],
+    "Paytm": ["rrn", "bank_transaction_id"],
+}
+
+# Checked without importing pyarrow so startup stays cheap.
+if importlib.util.find_spec("pyarrow") is not None:
+    TEXT_DTYPE = "string[pyarrow]"
+else:
+    TEXT_DTYPE = "string"
+
+_master_data = None
+_session_pool = None
+_session_pool_lock = threading.Lock()
+_stage_state = threading.local()
+
+
+def get_session_pool():
+    global _session_pool
+    with _session_pool_lock:
+        if _session_pool is None:
+            import cx_Oracle
+
+            _session_pool = cx_Oracle.SessionPool(
+                user=os.getenv("VMART_VULCAN_GIN_DB_USER"),
+                password=os.getenv("VMART_VULCAN_GIN_DB_PASS"),
+                dsn=os.getenv("VMART_VULCAN_GIN_DB_HOST"),
+                min=1,
+                max=ORACLE_POOL_MAX_SESSIONS,
+                increment=1,
+                threaded=True,
+                getmode=cx_Oracle.SPOOL_ATTRVAL_WAIT,
+            )
+    return _session_pool
+
+
+def close_session_pool():
+    global _session_pool
+    with _session_pool_lock:
+        if _session_pool is not None:
+            _session_pool.close()
+            _session_pool = None
+
+
+@contextmanager
+def _sqlite_cursor():
+    connection = sqlite3.connect(GINESYS_SQLITE_PATH)
+    connection.create_function("TRUNC", 1, lambda value: value and value[:10])
+    try:
+        cursor = connection.cursor()
+        cursor.arraysize = ORACLE_FETCH_ARRAYSIZE
+        yield cursor
+    finally:
+        connection.close()
 
 
+@contextmanager
 def get_cursor():
-    connection = cx_Oracle.connect(
-        os.getenv("VMART_VULCAN_GIN_DB_USER"),
-        os.getenv("VMART_VULCAN_GIN_DB_PASS"),
-        os.getenv("VMART_VULCAN_GIN_DB_HOST"),
-    )
-    cursor = connection.cursor()
-    return connection, cursor
+    if GINESYS_SQLITE_PATH:
+        with _sqlite_cursor() as cursor:
+            yield cursor
+        return
+
+    pool = get_session_pool()
+    connection = pool.acquire()
+    try:
+        cursor = connection.cursor()
+        cursor.arraysize = ORACLE_FETCH_ARRAYSIZE
+        cursor.prefetchrows = ORACLE_FETCH_ARRAYSIZE
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+    finally:
+        pool.release(connection)
 
 
 def send_message(message_obj):
     json_string = json.dumps(message_obj)
-    print(json_string)
+    print(json_string, flush=True)
+
+
+def record_rows(**counts):
+    stack = getattr(_stage_state, "stack", None)
+    if stack:
+        stack[-1].update({name: int(value) for name, value in counts.items()})
 
 
-def fetch_sbi_data():
+def _start_profiler(name):
+    if not PROFILE_MODE or getattr(_stage_state, "profiling", False):
+        return None
+    if PROFILE_STAGES and name not in PROFILE_STAGES:
+        return None
+
+    if PROFILE_MODE == "pyinstrument":
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    _stage_state.profiling = True
+    return profiler
+
+
+def _stop_profiler(name, profiler):
+    _stage_state.profiling = False
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    file_name = re.sub(r"\W+", "_", name).strip("_")
+    if PROFILE_MODE == "pyinstrument":
+        profiler.stop()
+        with open(os.path.join(PROFILE_DIR, f"{file_name}.html"), "w") as handle:
+            handle.write(profiler.output_html())
+    else:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{file_name}.prof"))
+
+
+@contextmanager
+def stage(name):
+    counts = {}
+    stack = getattr(_stage_state, "stack", None)
+    if stack is None:
+        stack = _stage_state.stack = []
+    stack.append(counts)
+
+    profiler = _start_profiler(name)
+    started_wall = time.perf_counter()
+    started_cpu = time.thread_time()
+    started_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    status = "ok"
     try:
-        csv_file_path_sbi = (
-            "/home/savyasachi/Downloads/Automation_Store_Sale_Reconciliation/SBI CC.csv"
+        yield counts
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        stack.pop()
+        if profiler is not None:
+            _stop_profiler(name, profiler)
+        send_message(
+            {
+                "severity": "info",
+                "event": "stage",
+                "stage": name,
+                "status": status,
+                "pid": os.getpid(),
+                "wall_time_s": round(time.perf_counter() - started_wall, 4),
+                "cpu_time_s": round(time.thread_time() - started_cpu, 4),
+                "peak_rss_delta_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                - started_rss,
+                **counts,
+            }
         )
-        excel_file_path = "/home/savyasachi/Downloads/Automation_Store_Sale_Reconciliation/MASTER FILE FOR COLLECTION_VOL-2.xlsb"
 
-        if not csv_file_path_sbi.endswith(".csv") or not excel_file_path.endswith(
-            (".xlsb", ".xls")
-        ):
+
+def run_stage(name, func, *args):
+    with stage(name):
+        return func(*args)
+
+
+def bajaj_ledger_path():
+    # Each download gets the next "(N)" suffix; the highest N is the latest.
+    try:
+        numbered = [
+            (int(match.group(1)), match.group(0))
+            for match in map(BAJAJ_LEDGER_PATTERN.fullmatch, os.listdir(INPUT_DIR))
+            if match
+        ]
+    except FileNotFoundError:
+        numbered = []
+    if not numbered:
+        return BAJAJ_LEDGER_PATH
+    return os.path.join(INPUT_DIR, max(numbered)[1])
+
+
+def business_date(value):
+    return pd.Timestamp(value).normalize()
+
+
+def business_days(start_date, end_date):
+    return pd.date_range(business_date(start_date), business_date(end_date), freq="D")
+
+
+def hdfc_file_path(day):
+    # HDFC settles a business day in the next day's file, e.g. 28-Dec in 8386-29122023.
+    settlement_day = business_date(day) + pd.Timedelta(days=1)
+    return os.path.join(INPUT_DIR, f"8386-{settlement_day:%d%m%Y}.xlsb")
+
+
+def new_mop_file_path(day):
+    day_label = f"{business_date(day):%d %b %y}".upper()
+    return os.path.join(INPUT_DIR, f"NEW MOP (Finance)-{day_label}.csv")
+
+
+def daily_file_paths(path_for_day, start_date, end_date, label):
+    paths = []
+    for day in business_days(start_date, end_date):
+        path = path_for_day(day)
+        if not os.path.exists(path):
             send_message(
                 {
-                    "severity": "error",
-                    "message": "Invalid file extension. Please provide .csv for SBI file and .xlsb or .xls for Excel file.",
+                    "severity": "warning",
+                    "message": f"{label} file for {day:%Y-%m-%d} not found: {path}",
                 }
             )
-            sys.exit(1)
+            continue
+        paths.append((day, path))
+
+    if not paths:
+        raise FileNotFoundError(
+            f"No {label} files found between {business_date(start_date):%Y-%m-%d} and {business_date(end_date):%Y-%m-%d}"
+        )
+    return paths
+
+
+def read_daily_files(path_for_day, read_file, start_date, end_date, label):
+    frames = []
+    for day, path in daily_file_paths(path_for_day, start_date, end_date, label):
+        frame = read_file(path)
+        frame["DATE"] = day
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_hdfc_settlement(path):
+    return with_row_offsets(read_tabular(path, HDFC_COLUMNS, sep="\t"))
+
+
+def sniff_format(path):
+    # Settlement files are often named after a format they are not in (the
+    # HDFC ".xlsb" is tab separated text), so the content decides.
+    with open(path, "rb") as handle:
+        head = handle.read(4096)
+    if head.startswith(OLE2_MAGIC):
+        return "xls"
+    if head.startswith(ZIP_MAGIC):
+        with zipfile.ZipFile(path) as archive:
+            names = {name.replace("\\", "/").lower() for name in archive.namelist()}
+        if "xl/workbook.bin" in names:
+            return "xlsb"
+        if "xl/workbook.xml" in names:
+            return "xlsx"
+        return "zip"
+    if b"\x00" in head:
+        return "binary"
+    return "text"
+
+
+def check_format(path, formats, label):
+    file_format = sniff_format(path)
+    if file_format not in formats:
+        send_message(
+            {
+                "severity": "error",
+                "message": f"Unsupported {label} file {path}: expected {' or '.join(sorted(formats))}, found {file_format}.",
+            }
+        )
+        sys.exit(1)
+    return file_format
+
+
+def excel_engine(file_format):
+    return "calamine" if HAS_CALAMINE else EXCEL_ENGINES[file_format]
+
+
+def read_workbook(path, sheet_name=0, header=0, columns=None):
+    # Each workbook is parsed once per version of the file; the sheet is kept
+    # as Parquet next to the inputs and read back from there afterwards.
+    fingerprint = file_fingerprint(path)
+    source_dir = os.path.join(
+        WORKBOOK_CACHE_DIR,
+        hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16],
+    )
+    version = f"{fingerprint['size']}-{fingerprint['mtime_ns']}"
+    options = repr((sheet_name, header, sorted(columns) if columns else None))
+    options_key = hashlib.sha256(options.encode()).hexdigest()[:16]
+    cache_path = os.path.join(source_dir, version, f"{options_key}.parquet")
+    if os.path.exists(cache_path):
+        return pd.read_parquet(cache_path)
+
+    frame = pd.read_excel(
+        path,
+        sheet_name=sheet_name,
+        header=header,
+        usecols=(lambda column: column in columns) if columns else None,
+        engine=excel_engine(check_format(path, WORKBOOK_FORMATS, "workbook")),
+    )
+    try:
+        atomic_write(
+            cache_path,
+            lambda tmp_path: frame.to_parquet(tmp_path, index=False, engine="pyarrow"),
+        )
+        for entry in os.listdir(source_dir):
+            if entry != version:
+                shutil.rmtree(os.path.join(source_dir, entry), ignore_errors=True)
+    except Exception as e:
+        send_message(
+            {
+                "severity": "warning",
+                "message": f"Could not cache {os.path.basename(path)} as Parquet: {e}",
+            }
+        )
+    return frame
+
+
+def read_tabular(path, columns=None, sep=",", header=0, encoding=None):
+    if check_format(path, WORKBOOK_FORMATS | {"text"}, "input") != "text":
+        return read_workbook(path, header=header, columns=columns)
+    return pd.read_csv(
+        path,
+        sep=sep,
+        header=header,
+        encoding=encoding,
+        usecols=(lambda column: column in columns) if columns else None,
+    )
+
+
+def clean_key(values):
+    keys = values.astype(str).str.replace("'", "", regex=False).str.strip()
+    keys = keys.str.replace(r"\.0$", "", regex=True)
+    return keys.where(values.notna()).astype(TEXT_DTYPE)
+
+
+def normalize_amount(values):
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype("float64").fillna(0)
+
+    text = pd.Series(values.to_numpy(), dtype=TEXT_DTYPE)
+    text = text.str.replace("'", "", regex=False).str.strip()
+    plain = text.str.fullmatch(PLAIN_AMOUNT_PATTERN).fillna(False).to_numpy(bool)
+    pending = ~plain & text.fillna("").ne("").to_numpy(bool)
+
+    amounts = np.zeros(len(text))
+    amounts[plain] = text[plain].astype("float64").to_numpy()
+
+    # Only cells that are not a plain number (quoted lists, thousand separators,
+    # several amounts in one cell) go through the regex path.
+    if pending.any():
+        parts = text[pending].str.findall(AMOUNT_PATTERN).explode().dropna()
+        parts = parts.astype(TEXT_DTYPE).str.replace(",", "", regex=False)
+        parts = parts.astype("float64")
+        amounts[pending] = (
+            parts.groupby(level=0)
+            .sum()
+            .reindex(text.index[pending], fill_value=0.0)
+            .to_numpy()
+        )
+
+    return pd.Series(amounts, index=values.index, name=values.name)
+
+
+def to_paise(amounts):
+    # Money is carried as int64 paise from here on, so sums and the Difference
+    # are exact and a zero check means zero.
+    return (amounts.fillna(0) * 100).round().astype("int64")
+
+
+def to_rupees(paise):
+    return paise / 100
+
+
+def parse_paytm_times(values):
+    return pd.to_datetime(values, format=PAYTM_TIME_FORMAT)
+
+
+def read_csv_header(path, encoding=None):
+    return pd.read_csv(path, nrows=0, encoding=encoding).columns
+
+
+def iter_csv_rows(
+    path,
+    key_column,
+    date_column,
+    amount_column,
+    parse_dates,
+    parse_amounts,
+    start_date,
+    end_date,
+    encoding=None,
+    reference_column=None,
+):
+    # Yields the in-range rows of each chunk with TIME as parsed and DATE as the
+    # business day; the index is the row's position in the file.
+    start_date, end_date = business_date(start_date), business_date(end_date)
+    columns = [key_column, date_column, amount_column]
+    if reference_column:
+        columns.append(reference_column)
+    input_rows = filtered_rows = 0
+    with pd.read_csv(
+        path,
+        usecols=columns,
+        dtype=dict.fromkeys(columns, str),
+        encoding=encoding,
+        chunksize=CSV_CHUNK_ROWS,
+    ) as reader:
+        for chunk in reader:
+            times = parse_dates(chunk[date_column].str.replace("'", "", regex=False))
+            dates = times.dt.normalize()
+            in_range = dates.between(start_date, end_date)
+            input_rows += len(chunk)
+            filtered_rows += int(in_range.sum())
+            if not in_range.any():
+                continue
+
+            rows = pd.DataFrame(
+                {
+                    key_column: clean_key(chunk.loc[in_range, key_column]),
+                    "TIME": times[in_range],
+                    "DATE": dates[in_range],
+                    amount_column: to_paise(
+                        parse_amounts(chunk.loc[in_range, amount_column])
+                    ),
+                }
+            )
+            if reference_column:
+                rows["REFERENCE"] = clean_key(chunk.loc[in_range, reference_column])
+            yield rows
+
+    record_rows(input_rows=input_rows, filtered_rows=filtered_rows)
+
+
+def transaction_lines(rows, key_column, amount_column, days):
+    # The columns the transaction index keys each row of the given days on.
+    rows = rows[rows[key_column].notna() & rows["DATE"].isin(pd.to_datetime(days))]
+    lines = pd.DataFrame(
+        {
+            "ROW": rows.index.astype("int64"),
+            "TERMINAL": rows[key_column].astype(TEXT_DTYPE),
+            "TIME": rows["TIME"].astype("datetime64[ns]"),
+            "DATE": rows["DATE"].astype("datetime64[ns]"),
+            "AMOUNT_PAISE": rows[amount_column].astype("int64"),
+        }
+    )
+    if "REFERENCE" in rows:
+        lines["REFERENCE"] = rows["REFERENCE"].astype(TEXT_DTYPE)
+    return lines.reset_index(drop=True)
+
+
+def aggregate_csv_by_day(
+    path,
+    key_column,
+    date_column,
+    amount_column,
+    parse_dates,
+    parse_amounts,
+    start_date,
+    end_date,
+    encoding=None,
+    reference_column=None,
+    line_days=None,
+):
+    # Only the needed columns are ever materialised, one chunk at a time, and each
+    # chunk is reduced to (key, DATE) totals before the next one is read. For
+    # line_days the same pass also keeps the rows the transaction index needs.
+    keys = [key_column, "DATE"]
+    partials = []
+    lines = []
+    for chunk in iter_csv_rows(
+        path,
+        key_column,
+        date_column,
+        amount_column,
+        parse_dates,
+        parse_amounts,
+        start_date,
+        end_date,
+        encoding,
+        reference_column,
+    ):
+        partials.append(
+            chunk.assign(ROW=chunk.index)
+            .groupby(keys, as_index=False)
+            .agg(
+                **{amount_column: (amount_column, "sum")},
+                ROWS=("ROW", "size"),
+                FIRST_ROW=("ROW", "min"),
+                LAST_ROW=("ROW", "max"),
+            )
+        )
+        if line_days:
+            lines.append(
+                transaction_lines(chunk, key_column, amount_column, line_days)
+            )
+    lines = pd.concat(lines, ignore_index=True) if lines else None
+
+    if not partials:
+        totals = pd.DataFrame(
+            {
+                key_column: pd.Series(dtype=object),
+                "DATE": pd.Series(dtype="datetime64[ns]"),
+                amount_column: pd.Series(dtype="int64"),
+                "ROWS": pd.Series(dtype="int64"),
+                "FIRST_ROW": pd.Series(dtype="int64"),
+                "LAST_ROW": pd.Series(dtype="int64"),
+            }
+        )
+        return totals, lines
+    totals = (
+        pd.concat(partials, ignore_index=True)
+        .groupby(keys, as_index=False)
+        .agg(
+            **{amount_column: (amount_column, "sum")},
+            ROWS=("ROWS", "sum"),
+            FIRST_ROW=("FIRST_ROW", "min"),
+            LAST_ROW=("LAST_ROW", "max"),
+        )
+    )
+    return totals, lines
+
+
+def terminal_detail(frame, store_column, terminal_column, amount_column):
+    # The per-terminal rows behind each store total. Fetchers attach it to
+    # their result as attrs["terminals"] and the cube keeps it for drilldown().
+    detail = frame.groupby(
+        [store_column, "DATE", terminal_column], as_index=False
+    ).agg(
+        AMOUNT=(amount_column, "sum"),
+        ROWS=("ROWS", "sum"),
+        FIRST_ROW=("FIRST_ROW", "min"),
+        LAST_ROW=("LAST_ROW", "max"),
+    )
+    return detail.rename(
+        columns={store_column: "STORE", terminal_column: "TERMINAL"}
+    ).astype({"AMOUNT": "int64", "ROWS": "int64"})
+
+
+def with_row_offsets(frame):
+    # One raw row each, numbered by its position in the source file.
+    return frame.rename_axis("ROW").reset_index().assign(
+        ROWS=1, FIRST_ROW=lambda rows: rows["ROW"], LAST_ROW=lambda rows: rows["ROW"]
+    )
+
+
+def _polars_text(column):
+    import polars as pl
+
+    text = pl.col(column).cast(pl.Utf8)
+    return text.str.replace_all("'", "", literal=True).str.strip_chars()
+
+
+def _polars_key(column):
+    return _polars_text(column).str.replace(r"\.0$", "").alias(column)
+
+
+def _polars_paise(column):
+    # Same reading as to_paise(normalize_amount(...)): every number in the cell,
+    # thousand separators removed, summed; empty cells are zero.
+    import polars as pl
+
+    parts = _polars_text(column).str.extract_all(AMOUNT_PATTERN)
+    rupees = (
+        parts.list.eval(
+            pl.element().str.replace_all(",", "", literal=True).cast(pl.Float64)
+        )
+        .list.sum()
+        .fill_null(0.0)
+    )
+    return (rupees * 100).round(0).cast(pl.Int64).alias(column)
+
+
+def _polars_lines(query, key_column, amount, days):
+    import polars as pl
+
+    columns = [
+        pl.col("ROW").cast(pl.Int64),
+        pl.col(key_column).alias("TERMINAL"),
+        pl.col("TIME"),
+        pl.col("DATE"),
+        amount.alias("AMOUNT_PAISE"),
+    ]
+    if "REFERENCE" in query.collect_schema():
+        columns.append(pl.col("REFERENCE"))
+    return query.filter(
+        pl.col(key_column).is_not_null()
+        & pl.col("DATE").dt.strftime("%Y-%m-%d").is_in(list(days))
+    ).select(columns)
+
+
+def _collect_totals(query, keys, amount_columns, lines=None):
+    # With a lines query, the totals and the transaction index rows come out of
+    # one scan of the files.
+    import polars as pl
+
+    totals = (
+        query.filter(pl.col(keys[0]).is_not_null())
+        .group_by(keys)
+        .agg(
+            [pl.col(column).sum() for column in amount_columns]
+            + [
+                pl.len().cast(pl.Int64).alias("ROWS"),
+                pl.col("ROW").min().cast(pl.Int64).alias("FIRST_ROW"),
+                pl.col("ROW").max().cast(pl.Int64).alias("LAST_ROW"),
+            ]
+        )
+    )
+    if lines is None:
+        totals = totals.collect(engine="streaming").to_pandas()
+    else:
+        totals, lines = pl.collect_all([totals, lines], engine="streaming")
+        totals, lines = totals.to_pandas(), lines.to_pandas()
+        for column in ["TERMINAL", "REFERENCE"]:
+            if column in lines:
+                lines[column] = lines[column].astype(TEXT_DTYPE)
+    totals[keys[0]] = totals[keys[0]].astype(TEXT_DTYPE)
+    record_rows(filtered_rows=int(totals["ROWS"].sum()))
+    return totals, lines
+
+
+def scan_csv_by_day(
+    path,
+    key_column,
+    date_column,
+    amount_column,
+    date_format,
+    start_date,
+    end_date,
+    encoding=None,
+    reference_column=None,
+    line_days=None,
+):
+    # Lazy counterpart of aggregate_csv_by_day: Polars only reads the needed
+    # columns and streams the filter and group-by over the file.
+    import polars as pl
+
+    start_date, end_date = business_date(start_date), business_date(end_date)
+    # Polars only decodes UTF-8. The key, date and amount columns are ASCII, so
+    # a lossy decode of the Latin-1 exports leaves them intact.
+    times = _polars_text(date_column).str.to_datetime(date_format, time_unit="ns")
+    columns = [
+        pl.col("ROW"),
+        _polars_key(key_column),
+        times.alias("TIME"),
+        times.dt.truncate("1d").alias("DATE"),
+        _polars_paise(amount_column),
+    ]
+    if reference_column:
+        columns.append(_polars_key(reference_column).alias("REFERENCE"))
+    query = (
+        pl.scan_csv(
+            path,
+            infer_schema=False,
+            encoding="utf8-lossy" if encoding else "utf8",
+            row_index_name="ROW",
+        )
+        .select(columns)
+        .filter(
+            pl.col("DATE").is_between(
+                start_date.to_pydatetime(), end_date.to_pydatetime()
+            )
+        )
+    )
+    lines = None
+    if line_days:
+        lines = _polars_lines(query, key_column, pl.col(amount_column), line_days)
+    return _collect_totals(query, [key_column, "DATE"], [amount_column], lines)
+
+
+def _scan_hdfc_file(path):
+    import polars as pl
+
+    if check_format(path, WORKBOOK_FORMATS | {"text"}, "HDFC settlement") == "text":
+        return pl.scan_csv(
+            path, separator="\t", infer_schema=False, row_index_name="ROW"
+        )
+    frame = read_workbook(path, columns=HDFC_COLUMNS)
+    return pl.from_pandas(frame).lazy().with_row_index("ROW")
+
+
+def scan_hdfc_by_day(start_date, end_date, line_days=None):
+    import polars as pl
+
+    query = pl.concat(
+        [
+            _scan_hdfc_file(path).select(
+                pl.col("ROW"),
+                _polars_key("TERMINAL NUMBER"),
+                pl.lit(day.to_pydatetime()).cast(pl.Datetime("ns")).alias("DATE"),
+                _polars_paise("DOMESTIC AMT"),
+                _polars_paise("INTNL AMT"),
+            )
+            for day, path in daily_file_paths(
+                hdfc_file_path, start_date, end_date, "HDFC settlement"
+            )
+        ]
+    ).with_columns(pl.col("DATE").alias("TIME"))
+    lines = None
+    if line_days:
+        amount = pl.col("DOMESTIC AMT") + pl.col("INTNL AMT")
+        lines = _polars_lines(query, "TERMINAL NUMBER", amount, line_days)
+    return _collect_totals(
+        query, ["TERMINAL NUMBER", "DATE"], ["DOMESTIC AMT", "INTNL AMT"], lines
+    )
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_master_cache(fingerprint):
+    manifest_path = os.path.join(MASTER_CACHE_DIR, "manifest.json")
+    try:
+        with open(manifest_path) as handle:
+            manifest = json.load(handle)
+    except (OSError, ValueError):
+        return None, None
+
+    if (
+        manifest.get("version") != MASTER_CACHE_VERSION
+        or manifest.get("size") != fingerprint["size"]
+    ):
+        return None, None
+
+    # mtime changes without a content change (copies, re-downloads) only cost a hash.
+    if manifest.get("mtime_ns") != fingerprint["mtime_ns"]:
+        fingerprint["sha256"] = content_hash(MASTER_FILE_PATH)
+        if manifest.get("sha256") != fingerprint["sha256"]:
+            return None, None
+        _write_master_manifest(dict(manifest, mtime_ns=fingerprint["mtime_ns"]))
+
+    sheet_dir = os.path.join(MASTER_CACHE_DIR, manifest["sha256"])
+    try:
+        master_data = {
+            name: pd.read_parquet(os.path.join(sheet_dir, f"{name}.parquet"))
+            for name in MASTER_SHEETS
+        }
+    except Exception:
+        return None, manifest["sha256"]
+    return master_data, manifest["sha256"]
+
+
+def _write_master_manifest(manifest):
+    manifest_path = os.path.join(MASTER_CACHE_DIR, "manifest.json")
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as handle:
+        json.dump(manifest, handle)
+    os.replace(tmp_path, manifest_path)
+
+
+def _write_master_cache(master_data, fingerprint):
+    sheet_dir = os.path.join(MASTER_CACHE_DIR, fingerprint["sha256"])
+    os.makedirs(sheet_dir, exist_ok=True)
+    for name, frame in master_data.items():
+        frame.to_parquet(os.path.join(sheet_dir, f"{name}.parquet"), index=False)
+    _write_master_manifest(dict(fingerprint, version=MASTER_CACHE_VERSION))
+
+    for entry in os.listdir(MASTER_CACHE_DIR):
+        stale_dir = os.path.join(MASTER_CACHE_DIR, entry)
+        if entry != fingerprint["sha256"] and os.path.isdir(stale_dir):
+            shutil.rmtree(stale_dir, ignore_errors=True)
+
+
+def _parse_master_workbook():
+    master_data = {}
+    file_format = check_format(
+        MASTER_FILE_PATH, WORKBOOK_FORMATS, "MASTER FILE FOR COLLECTION_VOL-2"
+    )
+    with pd.ExcelFile(MASTER_FILE_PATH, engine=excel_engine(file_format)) as workbook:
+        for name, options in MASTER_SHEETS.items():
+            frame = workbook.parse(**options)
+            for column in frame.columns:
+                if column in MASTER_KEY_COLUMNS:
+                    frame[column] = clean_key(frame[column])
+                else:
+                    frame[column] = frame[column].astype(TEXT_DTYPE)
+            master_data[name] = frame
+    return master_data
+
+
+def load_master_data():
+    global _master_data
+    if _master_data is not None:
+        return _master_data
+
+    fingerprint = file_fingerprint(MASTER_FILE_PATH)
+    master_data, cached_hash = _read_master_cache(fingerprint)
+    if master_data is None:
+        master_data = _parse_master_workbook()
+        if "sha256" not in fingerprint:
+            fingerprint["sha256"] = cached_hash or content_hash(MASTER_FILE_PATH)
+        try:
+            _write_master_cache(master_data, fingerprint)
+        except Exception as e:
+            send_message(
+                {
+                    "severity": "warning",
+                    "message": f"Could not cache MASTER FILE FOR COLLECTION_VOL-2 sheets: {e}",
+                }
+            )
+
+    _master_data = master_data
+    return _master_data
+
+
+def reload_master_data():
+    global _master_data
+    previous, _master_data = _master_data, None
+    try:
+        return load_master_data()
+    except BaseException:
+        _master_data = previous
+        raise
+
+
+def get_master_sheet(name):
+    return load_master_data()[name].copy()
+
+
+def fetch_sbi_data(
+    start_date=DEFAULT_BUSINESS_DATE, end_date=DEFAULT_BUSINESS_DATE, engine=ENGINE
+):
+    try:
+        csv_file_path_sbi = SBI_CSV_PATH
+        check_format(csv_file_path_sbi, {"text"}, "SBI CC")
 
-        dt_csv_sbi = pd.read_csv(csv_file_path_sbi, index_col=False)
-        if "TID" not in dt_csv_sbi.columns:
+        header = read_csv_header(csv_file_path_sbi)
+        if "TID" not in header:
             send_message(
                 {"severity": "error", "message": "Missing 'TID' column in SBI CC file."}
             )
             sys.exit(1)
-        dt_csv_sbi["TID"] = dt_csv_sbi["TID"].str.replace("'", "")
 
-        dt_csv_sbi["Tran Date"] = pd.to_datetime(dt_csv_sbi["Tran Date"])
-        dt_csv_sbi["Tran Date"] = dt_csv_sbi["Tran Date"].dt.date
-
-        dt_csv_sbi = dt_csv_sbi[
-            dt_csv_sbi["Tran Date"] == pd.to_datetime("2023-12-28").date()
-        ]
+        reference = transaction_reference("SBI", header)
+        deliveries, pending = transaction_deliveries("SBI", start_date, end_date)
+        if engine == "polars":
+            dt_csv_sbi, lines = scan_csv_by_day(
+                csv_file_path_sbi,
+                "TID",
+                "Tran Date",
+                "Net Amount",
+                None,
+                start_date,
+                end_date,
+                reference_column=reference,
+                line_days=pending,
+            )
+        else:
+            dt_csv_sbi, lines = aggregate_csv_by_day(
+                csv_file_path_sbi,
+                "TID",
+                "Tran Date",
+                "Net Amount",
+                pd.to_datetime,
+                normalize_amount,
+                start_date,
+                end_date,
+                reference_column=reference,
+                line_days=pending,
+            )
 
-        dt_excel_sbi = pd.read_excel(
-            excel_file_path, sheet_name=11, usecols=["TID", "LOCATION NAME"]
+        dt_csv_sbi = drop_duplicates(
+            dt_csv_sbi,
+            "TID",
+            "Net Amount",
+            dedupe_transactions("SBI", deliveries, pending, lines, reference),
         )
 
+        dt_excel_sbi = get_master_sheet("sbi_tid")
+
         if (
             "TID" not in dt_excel_sbi.columns
             or "LOCATION NAME" not in dt_excel_sbi.columns
@@ -80,17 +1064,24 @@ def fetch_sbi_data():
 
         dt_excel_sbi = dt_excel_sbi.drop_duplicates(subset="TID")
 
-        dt_csv_sbi["TID"] = dt_csv_sbi["TID"].astype(str)
-        dt_excel_sbi["TID"] = dt_excel_sbi["TID"].astype(str)
-
         merged_data = pd.merge(dt_csv_sbi, dt_excel_sbi, on="TID", how="left")
+        unmatched = merged_data["LOCATION NAME"].isna()
+        record_rows(
+            joined_rows=(~unmatched).sum(),
+            unmatched_keys=merged_data.loc[unmatched, "TID"].nunique(),
+        )
 
-        final_sbi = merged_data[["LOCATION NAME", "Net Amount"]]
+        final_sbi = merged_data[["LOCATION NAME", "DATE", "Net Amount"]]
         final_sbi = final_sbi.rename(
             columns={"LOCATION NAME": "STORE", "Net Amount": "SBI_total_amt"}
         )
 
-        final_sbi = final_sbi.groupby("STORE", as_index=False)["SBI_total_amt"].sum()
+        final_sbi = final_sbi.groupby(["STORE", "DATE"], as_index=False)[
+            "SBI_total_amt"
+        ].sum()
+        final_sbi.attrs["terminals"] = terminal_detail(
+            merged_data, "LOCATION NAME", "TID", "Net Amount"
+        )
 
         final_sbi["SBI_total_amt"].fillna(0, inplace=True)
 
@@ -109,27 +1100,11 @@ def fetch_sbi_data():
     return None
 
 
-def fetch_hdfc():
+def fetch_hdfc(
+    start_date=DEFAULT_BUSINESS_DATE, end_date=DEFAULT_BUSINESS_DATE, engine=ENGINE
+):
     try:
-        excel_file_path = "/home/savyasachi/Downloads/Automation_Store_Sale_Reconciliation/MASTER FILE FOR COLLECTION_VOL-2.xlsb"
-        excel_file_path_hdfc = "/home/savyasachi/Downloads/Automation_Store_Sale_Reconciliation/8386-29122023.xlsb"
-
-        if not excel_file_path.endswith(".xlsb") or not excel_file_path_hdfc.endswith(
-            ".xlsb"
-        ):
-            send_message(
-                {
-                    "severity": "error",
-                    "message": "Invalid file extension. Please provide .xlsb for both HDFC and Master Excel files.",
-                }
-            )
-            sys.exit(1)
-
-        dt_excel_master = pd.read_excel(
-            excel_file_path,
-            sheet_name=4,
-            usecols=["HDFC TID", "Store Locations"],
-        )
+        dt_excel_master = get_master_sheet("hdfc_tid")
 
         missing_master_headers = [
             col
@@ -145,7 +1120,18 @@ def fetch_hdfc():
             )
             sys.exit(1)
 
-        dt_excel_hdfc = pd.read_table(excel_file_path_hdfc)
+        deliveries, pending = transaction_deliveries("HDFC", start_date, end_date)
+        lines = None
+        if engine == "polars":
+            dt_excel_hdfc, lines = scan_hdfc_by_day(start_date, end_date, pending)
+        else:
+            dt_excel_hdfc = read_daily_files(
+                hdfc_file_path,
+                read_hdfc_settlement,
+                start_date,
+                end_date,
+                "HDFC settlement",
+            )
 
         if "TERMINAL NUMBER" not in dt_excel_hdfc.columns:
             send_message(
@@ -156,8 +1142,31 @@ def fetch_hdfc():
             )
             sys.exit(1)
 
-        dt_excel_hdfc["TERMINAL NUMBER"] = dt_excel_hdfc["TERMINAL NUMBER"].astype(str)
-        dt_excel_master["HDFC TID"] = dt_excel_master["HDFC TID"].astype(str)
+        if engine != "polars":
+            # The Polars scan already returns paise totals.
+            for column in ["DOMESTIC AMT", "INTNL AMT"]:
+                dt_excel_hdfc[column] = to_paise(
+                    normalize_amount(dt_excel_hdfc[column])
+                )
+
+        dt_excel_hdfc["TERMINAL NUMBER"] = clean_key(dt_excel_hdfc["TERMINAL NUMBER"])
+        if engine != "polars" and pending:
+            rows = dt_excel_hdfc.set_index("ROW").assign(
+                TIME=lambda frame: frame["DATE"],
+                AMOUNT_PAISE=lambda frame: frame["DOMESTIC AMT"] + frame["INTNL AMT"],
+            )
+            lines = transaction_lines(rows, "TERMINAL NUMBER", "AMOUNT_PAISE", pending)
+        # Settlement rows carry no time, so no row repeats another; the index
+        # still records each file and reports resent ones.
+        dedupe_transactions("HDFC", deliveries, pending, lines)
+
+        known = dt_excel_hdfc["TERMINAL NUMBER"].isin(dt_excel_master["HDFC TID"])
+        record_rows(
+            input_rows=len(dt_excel_hdfc),
+            filtered_rows=len(dt_excel_hdfc),
+            joined_rows=known.sum(),
+            unmatched_keys=dt_excel_hdfc.loc[~known, "TERMINAL NUMBER"].nunique(),
+        )
 
         merged_data = pd.merge(
             dt_excel_master,
@@ -170,25 +1179,18 @@ def fetch_hdfc():
         merged_data = merged_data.drop(columns=["TERMINAL NUMBER"])
         merged_data = merged_data.rename(columns={"HDFC TID": "TID"})
 
-        merged_data["INTNL AMT"] = pd.to_numeric(
-            merged_data["INTNL AMT"], errors="coerce"
-        )
-        merged_data["DOMESTIC AMT"] = pd.to_numeric(
-            merged_data["DOMESTIC AMT"], errors="coerce"
-        )
-
-        merged_data["INTNL AMT"].fillna(0, inplace=True)
-        merged_data["DOMESTIC AMT"].fillna(0, inplace=True)
-
-        merged_data["hdfc_total_amt"] = (
-            merged_data["DOMESTIC AMT"] + merged_data["INTNL AMT"]
-        )
+        amounts = merged_data[["DOMESTIC AMT", "INTNL AMT"]].fillna(0).astype("int64")
+        merged_data["hdfc_total_amt"] = amounts["DOMESTIC AMT"] + amounts["INTNL AMT"]
 
-        final_hdfc = merged_data.groupby("Store Locations", as_index=False)[
+        final_hdfc = merged_data.groupby(["Store Locations", "DATE"], as_index=False)[
             "hdfc_total_amt"
         ].sum()
         final_hdfc = final_hdfc.rename(columns={"Store Locations": "STORE"})
         final_hdfc = final_hdfc[final_hdfc["STORE"] != "0x2a"]
+        terminals = terminal_detail(
+            merged_data, "Store Locations", "TID", "hdfc_total_amt"
+        )
+        final_hdfc.attrs["terminals"] = terminals[terminals["STORE"] != "0x2a"]
 
         final_hdfc["hdfc_total_amt"].fillna(0, inplace=True)
 
@@ -204,77 +1206,171 @@ def fetch_hdfc():
     return None
 
 
-def fetch_ginesys_advance():
-    con, cursor = get_cursor()
-
-    cursor.execute(
-        """
-        SELECT ADMSITE_CODE, MOPDESC, SUM(BASEAMT) AS TOTAL_BASEAMT, MAX(BILLDATE) AS MAX_BILLDATE
-        FROM PSITE_POSBILLMOP@hitesh_tovmrl
-        WHERE MOPDESC IN ('Credit Card', 'Paytm_EDC_1')
-        AND BILLDATE BETWEEN TO_DATE('2023-12-28 00:00:00', 'yyyy/mm/dd HH24:MI:SS')
-                        AND TO_DATE('2023-12-28 23:59:59', 'yyyy/mm/dd HH24:MI:SS')
-        GROUP BY ADMSITE_CODE, MOPDESC
-        """
-    )
-    render_data = cursor.fetchall()
-
-    columns = ["ADMSITE_CODE", "MOPDESC", "TOTAL_BASEAMT", "MAX_BILLDATE"]
-    df = pd.DataFrame(render_data, columns=columns)
-
-    cursor.execute(
-        """
-        SELECT CODE, SHRTNAME
-        FROM ADMSITE@hitesh_tovmrl
-        """
-    )
-    site_data = cursor.fetchall()
-    site_columns = ["CODE", "SHRTNAME"]
-    df_site = pd.DataFrame(site_data, columns=site_columns)
-
-    merged_df = pd.merge(df, df_site, left_on="ADMSITE_CODE", right_on="CODE")
+def ginesys_chunks(start_date, end_date, chunk_days):
+    # Clipped to the range, but on the same calendar boundaries whatever its
+    # start, so a pull resumed with another --from still finds its windows.
+    days = business_days(start_date, end_date)
+    windows = (days - business_date(GINESYS_CHUNK_EPOCH)).days // max(chunk_days, 1)
+    return [
+        (chunk.min(), chunk.max())
+        for _, chunk in pd.Series(days).groupby(windows.to_numpy())
+    ]
 
-    merged_df = merged_df.drop(columns=["ADMSITE_CODE", "CODE"])
 
-    merged_df = merged_df.rename(columns={"SHRTNAME": "STORE"})
+@contextmanager
+def checkpoint_lock(checkpoint_dir):
+    # Every pull holds a shared lock on its query's checkpoints while it runs;
+    # they are only deleted under an exclusive one, so no pull loses a window
+    # it is about to read.
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    with open(os.path.join(checkpoint_dir, ".lock"), "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_SH)
+        yield handle
 
-    total_ginesys_advance = merged_df.groupby("STORE", as_index=False).agg(
-        {"TOTAL_BASEAMT": "sum", "MAX_BILLDATE": "max"}
-    )
 
-    total_ginesys_advance = total_ginesys_advance.rename(
-        columns={
-            "TOTAL_BASEAMT": "total_ginesys_advance",
-            "MAX_BILLDATE": "max_BILLDATE",
+def clean_checkpoints(handle, checkpoint_dir, finished):
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        # Another pull is using the windows; a later one cleans up.
+        return
+    cutoff = time.time() - GINESYS_CHECKPOINT_MAX_AGE_DAYS * 24 * 3600
+    for entry in os.listdir(checkpoint_dir):
+        path = os.path.join(checkpoint_dir, entry)
+        if not entry.endswith(".parquet"):
+            continue
+        try:
+            if path in finished or os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _fetch_arrow(cursor, columns):
+    import pyarrow as pa
+
+    # Each batch goes straight into Arrow columns instead of piling up as
+    # Python tuples for the whole window.
+    batches = []
+    while True:
+        rows = cursor.fetchmany(ORACLE_FETCH_ARRAYSIZE)
+        if not rows:
+            break
+        batches.append(pa.table(dict(zip(columns, map(pa.array, zip(*rows))))))
+    if not batches:
+        return pa.table({column: pa.nulls(0) for column in columns})
+    return pa.concat_tables(batches, promote_options="permissive")
+
+
+def extract_ginesys(sql, columns, start_date, end_date):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Checkpoints belong to one query text and database, so an edited query
+    # or a different stand-in never resumes from another's windows.
+    database = GINESYS_SQLITE_PATH or os.getenv("VMART_VULCAN_GIN_DB_HOST", "")
+    query_key = hashlib.sha256(f"{sql}|{database}".encode()).hexdigest()[:16]
+    checkpoint_dir = os.path.join(GINESYS_CHECKPOINT_DIR, query_key)
+    today = pd.Timestamp.today().normalize()
+
+    chunks = ginesys_chunks(start_date, end_date, GINESYS_CHUNK_DAYS)
+    tables = []
+    checkpoints = set()
+    resumed = 0
+    with checkpoint_lock(checkpoint_dir) as lock:
+        for chunk_start, chunk_end in chunks:
+            path = os.path.join(
+                checkpoint_dir, f"{chunk_start:%Y-%m-%d}_{chunk_end:%Y-%m-%d}.parquet"
+            )
+            if os.path.exists(path):
+                tables.append(pq.read_table(path))
+                checkpoints.add(path)
+                resumed += 1
+                continue
+
+            with get_cursor() as cursor:
+                cursor.execute(
+                    sql,
+                    {
+                        "start_date": chunk_start.to_pydatetime(),
+                        "end_date": (chunk_end + pd.Timedelta(days=1)).to_pydatetime(),
+                    },
+                )
+                table = _fetch_arrow(cursor, columns)
+            tables.append(table)
+            # Bills can still be posted to an open day, so it is always refetched.
+            if chunk_end < today:
+                atomic_write(path, lambda tmp_path: pq.write_table(table, tmp_path))
+                checkpoints.add(path)
+
+        # The whole range is in hand, so its windows are not needed to resume.
+        clean_checkpoints(lock, checkpoint_dir, checkpoints)
+
+    send_message(
+        {
+            "severity": "info",
+            "event": "extract",
+            "chunks": len(chunks),
+            "resumed": resumed,
+            "checkpoint_dir": checkpoint_dir,
         }
     )
+    return pa.concat_tables(tables, promote_options="permissive").to_pandas()
+
+
+def fetch_ginesys_advance(
+    start_date=DEFAULT_BUSINESS_DATE, end_date=DEFAULT_BUSINESS_DATE
+):
+    columns = ["STORE", "DATE", "TERMINAL", "AMOUNT", "max_BILLDATE", "ROWS"]
+    by_mop = extract_ginesys(GINESYS_ADVANCE_SQL, columns, start_date, end_date)
+    by_mop["DATE"] = pd.to_datetime(by_mop["DATE"])
+    by_mop["AMOUNT"] = to_paise(pd.to_numeric(by_mop["AMOUNT"]))
+
+    total_ginesys_advance = (
+        by_mop.groupby(["STORE", "DATE"], as_index=False)
+        .agg(
+            total_ginesys_advance=("AMOUNT", "sum"),
+            max_BILLDATE=("max_BILLDATE", "max"),
+        )
+    )
+    # Bills have no file offsets, so the drilldown carries the MOP split only.
+    total_ginesys_advance.attrs["terminals"] = (
+        by_mop[["STORE", "DATE", "TERMINAL", "AMOUNT", "ROWS"]]
+        .assign(FIRST_ROW=pd.NA, LAST_ROW=pd.NA)
+        .astype({"FIRST_ROW": "Int64", "LAST_ROW": "Int64"})
+    )
 
-    print(total_ginesys_advance)
+    record_rows(input_rows=int(by_mop["ROWS"].sum()))
     return total_ginesys_advance
 
 
-def fetch_ginesys_new():
+def fetch_ginesys_new(start_date=DEFAULT_BUSINESS_DATE, end_date=DEFAULT_BUSINESS_DATE):
     try:
-        new_mop_path = "/home/savyasachi/Downloads/Automation_Store_Sale_Reconciliation/NEW MOP (Finance)-28 DEC 23.csv"
-
-        if not new_mop_path.endswith(".csv"):
-            send_message(
-                {
-                    "severity": "error",
-                    "message": "Invalid file extension. Please provide a .csv file for the input.",
-                }
-            )
-            sys.exit(1)
-
-        dt_new_mop = pd.read_csv(new_mop_path, header=1, encoding="ISO-8859-1")
+        dt_new_mop = read_daily_files(
+            new_mop_file_path,
+            lambda path: with_row_offsets(
+                read_tabular(path, NEW_MOP_COLUMNS, header=1, encoding="ISO-8859-1")
+            ),
+            start_date,
+            end_date,
+            "NEW MOP (Finance)",
+        )
 
         filtered_new_mop = dt_new_mop[
             (dt_new_mop["Ledger"] == "Credit Card Receivable")
             & (dt_new_mop["Entry type long"] == "POS Journal")
         ]
+        record_rows(input_rows=len(dt_new_mop), filtered_rows=len(filtered_new_mop))
+        filtered_new_mop = filtered_new_mop.assign(
+            **{
+                "Balance SUM": to_paise(
+                    normalize_amount(filtered_new_mop["Balance SUM"])
+                )
+            }
+        )
 
         total_new_ginesys = (
-            filtered_new_mop.groupby("Source Short Name")["Balance SUM"]
+            filtered_new_mop.groupby(["Source Short Name", "DATE"])["Balance SUM"]
             .sum()
             .reset_index()
         )
@@ -283,6 +1379,10 @@ def fetch_ginesys_new():
         )
 
         total_new_ginesys["total_ginesys_new"].fillna(0, inplace=True)
+        # NEW MOP is already per store; its detail keeps the ledger rows.
+        total_new_ginesys.attrs["terminals"] = terminal_detail(
+            filtered_new_mop, "Source Short Name", "Ledger", "Balance SUM"
+        )
 
         return total_new_ginesys
 
@@ -296,28 +1396,14 @@ def fetch_ginesys_new():
     return None
 
 
-def bajaj_mpr():
+def bajaj_mpr(start_date=DEFAULT_BUSINESS_DATE, end_date=DEFAULT_BUSINESS_DATE):
     try:
-        bajaj_excel = "/home/savyasachi/Downloads/Automation_Store_Sale_Reconciliation/Common_Ledger (26).xlsx"
-        mpr_master = "/home/savyasachi/Downloads/Automation_Store_Sale_Reconciliation/MASTER FILE FOR COLLECTION_VOL-2.xlsb"
-
-        if not (
-            bajaj_excel.endswith((".xlsx", ".xlsb", ".xls"))
-            and mpr_master.endswith((".xlsx", ".xlsb", ".xls"))
-        ):
-            send_message(
-                {
-                    "severity": "error",
-                    "message": "Invalid file extension. Please provide .xlsx, .xlsb, or .xls files for the input.",
-                }
-            )
-            sys.exit(1)
-
-        df_mpr_master = pd.read_excel(
-            mpr_master, sheet_name=14, usecols=["BFL\nDEALER CODE", "Store name"]
-        )
+        bajaj_excel = bajaj_ledger_path()
+        df_mpr_master = get_master_sheet("bfl_dealer")
 
-        df_bajaj = pd.read_excel(bajaj_excel)
+        df_bajaj = with_row_offsets(read_workbook(bajaj_excel, columns=BAJAJ_COLUMNS))
+        df_bajaj["Supplier ID"] = clean_key(df_bajaj["Supplier ID"])
+        df_bajaj["Invoice Amt"] = to_paise(normalize_amount(df_bajaj["Invoice Amt"]))
         df_bajaj["Invoice Date"] = df_bajaj["Invoice Date"].str.replace("'", "")
 
         df_bajaj["Invoice Date"] = pd.to_datetime(
@@ -325,8 +1411,23 @@ def bajaj_mpr():
         )
 
         df_bajaj_filtered = df_bajaj[
-            df_bajaj["Invoice Date"] == pd.to_datetime("2023-12-28")
-        ]
+            df_bajaj["Invoice Date"].between(
+                business_date(start_date), business_date(end_date)
+            )
+        ].rename(columns={"Invoice Date": "DATE"})
+        # Ledger rows have no time either; the index only reports overlaps.
+        deliveries, pending = transaction_deliveries("Bajaj", start_date, end_date)
+        lines = None
+        if pending:
+            lines = transaction_lines(
+                df_bajaj_filtered.set_index("ROW").assign(
+                    TIME=lambda frame: frame["DATE"]
+                ),
+                "Supplier ID",
+                "Invoice Amt",
+                pending,
+            )
+        dedupe_transactions("Bajaj", deliveries, pending, lines)
 
         merged_data = pd.merge(
             df_mpr_master,
@@ -339,10 +1440,18 @@ def bajaj_mpr():
         filtered_merged_data = merged_data[
             merged_data["Supplier ID"] == merged_data["BFL\nDEALER CODE"]
         ]
+        known = df_bajaj_filtered["Supplier ID"].isin(df_mpr_master["BFL\nDEALER CODE"])
+        record_rows(
+            input_rows=len(df_bajaj),
+            filtered_rows=len(df_bajaj_filtered),
+            joined_rows=len(filtered_merged_data),
+            unmatched_keys=df_bajaj_filtered.loc[~known, "Supplier ID"].nunique(),
+        )
 
         bajaj_total = (
-            filtered_merged_data.groupby("Store name")["Invoice Amt"]
+            filtered_merged_data.groupby(["Store name", "DATE"])["Invoice Amt"]
             .sum()
+            .astype("int64")
             .reset_index()
         )
         bajaj_total = bajaj_total.rename(
@@ -351,6 +1460,9 @@ def bajaj_mpr():
                 "Invoice Amt": "BAJAJ_total_amt",
             }
         )
+        bajaj_total.attrs["terminals"] = terminal_detail(
+            filtered_merged_data, "Store name", "Supplier ID", "Invoice Amt"
+        )
 
         bajaj_total["BAJAJ_total_amt"].fillna(0, inplace=True)
 
@@ -366,26 +1478,16 @@ def bajaj_mpr():
     return None
 
 
-def paytm_mpr():
+def paytm_mpr(
+    start_date=DEFAULT_BUSINESS_DATE, end_date=DEFAULT_BUSINESS_DATE, engine=ENGINE
+):
     try:
-        paytm_mpr = "/home/savyasachi/Downloads/Automation_Store_Sale_Reconciliation/Paytm_EDC.csv"
-        mpr_master = "/home/savyasachi/Downloads/Automation_Store_Sale_Reconciliation/MASTER FILE FOR COLLECTION_VOL-2.xlsb"
-
-        if not (
-            paytm_mpr.endswith(".csv")
-            or mpr_master.endswith((".xlsx", ".xlsb", ".xls"))
-        ):
-            send_message(
-                {
-                    "severity": "error",
-                    "message": "Invalid file extension. Please provide .csv for Paytm file and .xlsx, .xlsb, or .xls for Master file.",
-                }
-            )
-            sys.exit(1)
+        paytm_mpr = PAYTM_CSV_PATH
+        check_format(paytm_mpr, {"text"}, "Paytm_EDC")
 
-        df_mpr_master = pd.read_excel(
-            mpr_master, sheet_name=3, header=1, usecols=["Production Mid", "LOCATION"]
-        ).drop_duplicates(subset=["Production Mid"])
+        df_mpr_master = get_master_sheet("paytm_mid").drop_duplicates(
+            subset=["Production Mid"]
+        )
 
         missing_master_headers = [
             col
@@ -401,9 +1503,8 @@ def paytm_mpr():
             )
             sys.exit(1)
 
-        df_paytm = pd.read_csv(paytm_mpr, encoding="ISO-8859-1", dtype=str)
-
-        if "original_mid" not in df_paytm.columns:
+        header = read_csv_header(paytm_mpr, encoding="ISO-8859-1")
+        if "original_mid" not in header:
             send_message(
                 {
                     "severity": "error",
@@ -412,22 +1513,43 @@ def paytm_mpr():
             )
             sys.exit(1)
 
-        df_paytm["original_mid"] = df_paytm["original_mid"].str.replace("'", "")
-        df_paytm["transaction_date"] = df_paytm["transaction_date"].str.replace("'", "")
+        reference = transaction_reference("Paytm", header)
+        deliveries, pending = transaction_deliveries("Paytm", start_date, end_date)
+        if engine == "polars":
+            df_paytm_filtered, lines = scan_csv_by_day(
+                paytm_mpr,
+                "original_mid",
+                "transaction_date",
+                "amount",
+                PAYTM_TIME_FORMAT,
+                start_date,
+                end_date,
+                encoding="ISO-8859-1",
+                reference_column=reference,
+                line_days=pending,
+            )
+        else:
+            df_paytm_filtered, lines = aggregate_csv_by_day(
+                paytm_mpr,
+                "original_mid",
+                "transaction_date",
+                "amount",
+                parse_paytm_times,
+                normalize_amount,
+                start_date,
+                end_date,
+                encoding="ISO-8859-1",
+                reference_column=reference,
+                line_days=pending,
+            )
 
-        df_paytm["amount"] = df_paytm["amount"].str.replace("'", "")
-        df_paytm["amount"] = df_paytm["amount"].apply(
-            lambda x: sum(map(float, re.findall(r"\d+\.\d+", str(x))))
+        df_paytm_filtered = drop_duplicates(
+            df_paytm_filtered,
+            "original_mid",
+            "amount",
+            dedupe_transactions("Paytm", deliveries, pending, lines, reference),
         )
 
-        df_paytm["transaction_date"] = pd.to_datetime(
-            df_paytm["transaction_date"], format="%d-%m-%Y %H:%M:%S"
-        ).dt.date
-
-        df_paytm_filtered = df_paytm[
-            df_paytm["transaction_date"] == pd.to_datetime("2023-12-28").date()
-        ]
-
         prev_total_paytm = df_paytm_filtered["amount"].sum()
 
         merged_data = pd.merge(
@@ -440,8 +1562,13 @@ def paytm_mpr():
             right_on="original_mid",
         )
         again_prev_total_paytm = merged_data["amount"].sum()
+        known = df_paytm_filtered["original_mid"].isin(df_mpr_master["Production Mid"])
+        record_rows(
+            joined_rows=len(merged_data),
+            unmatched_keys=df_paytm_filtered.loc[~known, "original_mid"].nunique(),
+        )
 
-        paytm_total_amt = merged_data.groupby("LOCATION", as_index=False)[
+        paytm_total_amt = merged_data.groupby(["LOCATION", "DATE"], as_index=False)[
             "amount"
         ].sum()
         paytm_total_amt = paytm_total_amt.rename(
@@ -449,6 +1576,9 @@ def paytm_mpr():
         )
 
         paytm_total_amt["Paytm_total_amt"].fillna(0, inplace=True)
+        paytm_total_amt.attrs["terminals"] = terminal_detail(
+            merged_data, "LOCATION", "original_mid", "amount"
+        )
 
         total_paytm = paytm_total_amt["Paytm_total_amt"].sum()
 
@@ -464,109 +1594,2174 @@ def paytm_mpr():
     return None
 
 
-def generate_csv():
-    sbi_data = fetch_sbi_data()
-    hdfc_data = fetch_hdfc()
-    ginesys_advance_data = fetch_ginesys_advance()
-    ginesys_new_data = fetch_ginesys_new()
-    bajaj_data = bajaj_mpr()
-    paytm_data = paytm_mpr()
+# File parsing is CPU bound and runs in worker processes; the Oracle query is
+# network bound and only needs a thread.
+PARSE_SOURCES = {
+    "SBI": fetch_sbi_data,
+    "HDFC": fetch_hdfc,
+    "Ginesys new": fetch_ginesys_new,
+    "Bajaj": bajaj_mpr,
+    "Paytm": paytm_mpr,
+}
+DB_SOURCES = {
+    "Ginesys advance": fetch_ginesys_advance,
+}
+
+# Fetchers that take an engine argument. NEW MOP stays on pandas: its store
+# key is the free-text Source Short Name, and a lossy decode of the Latin-1
+# file would turn accented names into U+FFFD, so they would stop matching
+# the Ginesys advance names.
+ENGINE_SOURCES = {"SBI", "HDFC", "Paytm"}
+
+STORE_NAME_PRIORITY = ["Ginesys advance", "Ginesys new"]
+
+SOURCE_COLUMNS = {
+    "SBI": "SBI_total_amt",
+    "HDFC": "hdfc_total_amt",
+    "Ginesys advance": "total_ginesys_advance",
+    "Ginesys new": "total_ginesys_new",
+    "Bajaj": "BAJAJ_total_amt",
+    "Paytm": "Paytm_total_amt",
+}
+
+# Files each (source, day) partition of the cube is computed from.
+SOURCE_INPUTS = {
+    "SBI": lambda day: [SBI_CSV_PATH, MASTER_FILE_PATH],
+    "HDFC": lambda day: [hdfc_file_path(day), MASTER_FILE_PATH],
+    "Ginesys advance": lambda day: [],
+    "Ginesys new": lambda day: [new_mop_file_path(day)],
+    "Bajaj": lambda day: [bajaj_ledger_path(), MASTER_FILE_PATH],
+    "Paytm": lambda day: [PAYTM_CSV_PATH, MASTER_FILE_PATH],
+}
+
+# Bump when a fetcher's transformation changes so stored partitions and
+# memoized fetcher results are rebuilt.
+CUBE_VERSION = 6
+
+
+def open_fetch_cache():
+    os.makedirs(FETCH_CACHE_DIR, exist_ok=True)
+    connection = sqlite3.connect(
+        os.path.join(FETCH_CACHE_DIR, "index.sqlite"), timeout=30
+    )
+    connection.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            bytes INTEGER NOT NULL,
+            last_used REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS file_hashes (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS stats (
+            source TEXT PRIMARY KEY,
+            hits INTEGER NOT NULL DEFAULT 0,
+            misses INTEGER NOT NULL DEFAULT 0,
+            evictions INTEGER NOT NULL DEFAULT 0
+        );
+        """
+    )
+    return connection
 
-    merged_data = pd.merge(sbi_data, hdfc_data, on="STORE", how="outer")
-    merged_data = pd.merge(merged_data, ginesys_advance_data, on="STORE", how="outer")
-    merged_data = pd.merge(merged_data, ginesys_new_data, on="STORE", how="outer")
-    merged_data = pd.merge(merged_data, bajaj_data, on="STORE", how="outer")
-    merged_data = pd.merge(merged_data, paytm_data, on="STORE", how="outer")
 
-    merged_data["total_CC_recd"] = merged_data[
-        ["SBI_total_amt", "hdfc_total_amt", "BAJAJ_total_amt", "Paytm_total_amt"]
-    ].sum(axis=1)
+def input_digest(connection, path):
+    # Hashes are remembered per size and mtime so an unchanged file is only
+    # read once; a touched but identical file still hashes to the same key.
+    try:
+        fingerprint = file_fingerprint(path)
+    except FileNotFoundError:
+        return "missing"
+    stored = connection.execute(
+        "SELECT size, mtime_ns, sha256 FROM file_hashes WHERE path = ?", (path,)
+    ).fetchone()
+    if stored and stored[:2] == (fingerprint["size"], fingerprint["mtime_ns"]):
+        return stored[2]
+
+    sha256 = content_hash(path)
+    with connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)",
+            (path, fingerprint["size"], fingerprint["mtime_ns"], sha256),
+        )
+    return sha256
+
+
+def fetch_cache_key(connection, source, start_date, end_date, *args):
+    days = business_days(start_date, end_date)
+    # Oracle days only stop changing once they are closed.
+    if source in DB_SOURCES:
+        if days[-1] >= pd.Timestamp.today().normalize():
+            return None
+        # Keyed on the database the rows come from, as the checkpoints are;
+        # a SQLite stand-in also by content, since it can be rewritten.
+        if GINESYS_SQLITE_PATH:
+            digest = input_digest(connection, GINESYS_SQLITE_PATH)
+            inputs = [f"{GINESYS_SQLITE_PATH}:{digest}"]
+        else:
+            inputs = [os.getenv("VMART_VULCAN_GIN_DB_HOST", "")]
+    else:
+        paths = sorted({path for day in days for path in SOURCE_INPUTS[source](day)})
+        inputs = [
+            f"{os.path.basename(path)}:{input_digest(connection, path)}"
+            for path in paths
+        ]
 
-    merged_data["Difference"] = (
-        merged_data["total_ginesys_advance"] + merged_data["total_ginesys_new"]
-    ) - merged_data["total_CC_recd"]
+    parts = [source, str(CUBE_VERSION), f"{days[0]:%Y-%m-%d}", f"{days[-1]:%Y-%m-%d}"]
+    parts += [str(arg) for arg in args] + inputs
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
 
-    merged_data.fillna(0, inplace=True)
 
-    merged_data = merged_data[
-        [
-            "STORE",
-            "total_ginesys_advance",
-            "total_ginesys_new",
-            "SBI_total_amt",
-            "hdfc_total_amt",
+def count_fetch_cache(connection, source, counter, amount=1):
+    with connection:
+        connection.execute(
+            f"""
+            INSERT INTO stats (source, {counter}) VALUES (?, ?)
+            ON CONFLICT (source)
+            DO UPDATE SET {counter} = {counter} + excluded.{counter}
+            """,
+            (source, amount),
+        )
+
+
+def _write_cached_table(frame, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Parquet records "string" but not whether it was Arrow or Python backed,
+    # so the storage goes in the schema metadata to come back unchanged.
+    # attrs (the terminal detail) are written as their own table instead.
+    frame = frame.copy(deep=False)
+    frame.attrs = {}
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    storage = {
+        column: dtype.storage
+        for column, dtype in frame.dtypes.items()
+        if isinstance(dtype, pd.StringDtype)
+    }
+    table = table.replace_schema_metadata(
+        {**table.schema.metadata, b"string_storage": json.dumps(storage).encode()}
+    )
+    pq.write_table(table, path)
+
+
+def _read_cached_table(path):
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path)
+    storage = json.loads(table.schema.metadata.get(b"string_storage", b"{}"))
+    return table.to_pandas().astype(
+        {column: pd.StringDtype(kind) for column, kind in storage.items()}
+    )
+
+
+def _read_fetch_entry(entry_dir):
+    # totals.parquet is written last, so its presence means the entry is whole.
+    totals_path = os.path.join(entry_dir, "totals.parquet")
+    if not os.path.exists(totals_path):
+        return None
+    frame = _read_cached_table(totals_path)
+    terminals_path = os.path.join(entry_dir, "terminals.parquet")
+    if os.path.exists(terminals_path):
+        frame.attrs["terminals"] = _read_cached_table(terminals_path)
+    return frame
+
+
+def _write_fetch_entry(connection, source, key, frame):
+    entry_dir = os.path.join(FETCH_CACHE_DIR, key)
+    tables = [("terminals", frame.attrs.get("terminals")), ("totals", frame)]
+    size = 0
+    for name, table in tables:
+        if table is None:
+            continue
+        path = os.path.join(entry_dir, f"{name}.parquet")
+        atomic_write(path, lambda tmp_path: _write_cached_table(table, tmp_path))
+        size += os.path.getsize(path)
+    with connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+            (key, source, size, time.time()),
+        )
+
+
+def evict_fetch_cache(connection, max_bytes=FETCH_CACHE_MAX_BYTES):
+    (total,) = connection.execute(
+        "SELECT COALESCE(SUM(bytes), 0) FROM entries"
+    ).fetchone()
+    oldest_first = connection.execute(
+        "SELECT key, source, bytes FROM entries ORDER BY last_used"
+    ).fetchall()
+    for key, source, size in oldest_first:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(os.path.join(FETCH_CACHE_DIR, key), ignore_errors=True)
+        with connection:
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+        count_fetch_cache(connection, source, "evictions")
+        total -= size
+
+
+def cached_fetch(source, fetcher, start_date, end_date, *args):
+    # Memoizes fetcher(start_date, end_date, *args) on the content of its
+    # inputs, so an unchanged acquirer file is never parsed twice.
+    if FETCH_CACHE_MAX_BYTES <= 0:
+        return fetcher(start_date, end_date, *args)
+
+    connection = open_fetch_cache()
+    try:
+        key = fetch_cache_key(connection, source, start_date, end_date, *args)
+        if key is None:
+            return fetcher(start_date, end_date, *args)
+
+        try:
+            frame = _read_fetch_entry(os.path.join(FETCH_CACHE_DIR, key))
+        except Exception:
+            frame = None
+        if frame is not None:
+            with connection:
+                connection.execute(
+                    "UPDATE entries SET last_used = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+            count_fetch_cache(connection, source, "hits")
+            record_rows(cache_hits=1)
+            return frame
+
+        count_fetch_cache(connection, source, "misses")
+        record_rows(cache_misses=1)
+        frame = fetcher(start_date, end_date, *args)
+        if frame is None:
+            return None
+        try:
+            _write_fetch_entry(connection, source, key, frame)
+            evict_fetch_cache(connection)
+        except Exception as e:
+            send_message(
+                {
+                    "severity": "warning",
+                    "message": f"Could not memoize {source} results: {e}",
+                }
+            )
+        return frame
+    finally:
+        connection.close()
+
+
+def fetch_cache_stats():
+    connection = open_fetch_cache()
+    try:
+        stats = pd.read_sql_query(
+            """
+            SELECT s.source AS SOURCE, s.hits AS HITS, s.misses AS MISSES,
+                   s.evictions AS EVICTIONS,
+                   COUNT(e.key) AS ENTRIES, COALESCE(SUM(e.bytes), 0) AS BYTES
+            FROM stats s
+            LEFT JOIN entries e ON e.source = s.source
+            GROUP BY s.source
+            ORDER BY s.source
+            """,
+            connection,
+        )
+    finally:
+        connection.close()
+    return stats
+
+
+# What each file input must look like, checked by preflight() on its header
+# and first rows before any source is parsed. "daily" inputs may miss some
+# days of a range, as read_daily_files allows.
+INPUT_SCHEMAS = {
+    "SBI": {
+        "label": "SBI CC",
+        "path": lambda day: SBI_CSV_PATH,
+        "formats": {"text"},
+        "columns": ["TID", "Tran Date", "Net Amount"],
+        "date_column": "Tran Date",
+    },
+    "HDFC": {
+        "label": "HDFC settlement",
+        "path": hdfc_file_path,
+        "formats": WORKBOOK_FORMATS | {"text"},
+        "columns": HDFC_COLUMNS,
+        "sep": "\t",
+        "daily": True,
+    },
+    "Ginesys new": {
+        "label": "NEW MOP (Finance)",
+        "path": new_mop_file_path,
+        "formats": WORKBOOK_FORMATS | {"text"},
+        "columns": NEW_MOP_COLUMNS,
+        "header": 1,
+        "encoding": "ISO-8859-1",
+        "daily": True,
+    },
+    "Bajaj": {
+        "label": "Common_Ledger",
+        "path": lambda day: bajaj_ledger_path(),
+        "formats": WORKBOOK_FORMATS,
+        "columns": BAJAJ_COLUMNS,
+        "date_column": "Invoice Date",
+        "date_format": "%d/%m/%Y",
+    },
+    "Paytm": {
+        "label": "Paytm_EDC",
+        "path": lambda day: PAYTM_CSV_PATH,
+        "formats": {"text"},
+        "columns": ["original_mid", "transaction_date", "amount"],
+        "date_column": "transaction_date",
+        "date_format": PAYTM_TIME_FORMAT,
+        "encoding": "ISO-8859-1",
+    },
+}
+MASTER_SHEET_SOURCES = {
+    "sbi_tid": "SBI",
+    "hdfc_tid": "HDFC",
+    "bfl_dealer": "Bajaj",
+    "paytm_mid": "Paytm",
+}
+
+
+def _problem(severity, source, path, message):
+    return {"severity": severity, "source": source, "path": path, "message": message}
+
+
+def check_input(source, path):
+    schema = INPUT_SCHEMAS[source]
+    label = schema["label"]
+    if not os.path.exists(path):
+        return [_problem("error", source, path, f"{label} file not found.")]
+
+    file_format = sniff_format(path)
+    if file_format not in schema["formats"]:
+        return [
+            _problem(
+                "error",
+                source,
+                path,
+                f"Unsupported {label} file: expected {' or '.join(sorted(schema['formats']))}, found {file_format}.",
+            )
+        ]
+
+    encoding = schema.get("encoding")
+    try:
+        if file_format == "text":
+            head = pd.read_csv(
+                path,
+                sep=schema.get("sep", ","),
+                header=schema.get("header", 0),
+                encoding=encoding,
+                nrows=PREFLIGHT_ROWS,
+                dtype=str,
+            )
+        else:
+            head = pd.read_excel(
+                path,
+                header=schema.get("header", 0),
+                nrows=PREFLIGHT_ROWS,
+                dtype=str,
+                engine=excel_engine(file_format),
+            )
+    except UnicodeDecodeError as e:
+        return [
+            _problem(
+                "error",
+                source,
+                path,
+                f"{label} is not readable as {encoding or 'UTF-8'}: {e}",
+            )
+        ]
+    except Exception as e:
+        return [_problem("error", source, path, f"Could not read {label}: {e}")]
+
+    missing = [column for column in schema["columns"] if column not in head.columns]
+    if missing:
+        return [
+            _problem(
+                "error",
+                source,
+                path,
+                f"Missing column(s) {', '.join(map(repr, missing))} in {label}.",
+            )
+        ]
+
+    date_column = schema.get("date_column")
+    if date_column:
+        values = head[date_column].dropna().str.replace("'", "", regex=False)
+        parsed = pd.to_datetime(
+            values, format=schema.get("date_format"), errors="coerce"
+        )
+        unparsed = values[parsed.isna()]
+        if len(unparsed):
+            return [
+                _problem(
+                    "error",
+                    source,
+                    path,
+                    f"Unreadable {date_column!r} in {label}, e.g. {unparsed.iloc[0]!r}"
+                    f" (expected {schema.get('date_format') or 'a date'}).",
+                )
+            ]
+    return []
+
+
+def check_master_sheets(names):
+    label = "MASTER FILE FOR COLLECTION_VOL-2"
+    sources = sorted({MASTER_SHEET_SOURCES[name] for name in names})
+    if not os.path.exists(MASTER_FILE_PATH):
+        return [
+            _problem("error", source, MASTER_FILE_PATH, f"{label} not found.")
+            for source in sources
+        ]
+    # Sheets only reach the Parquet cache after a successful parse.
+    if _read_master_cache(file_fingerprint(MASTER_FILE_PATH))[0] is not None:
+        return []
+
+    file_format = sniff_format(MASTER_FILE_PATH)
+    if file_format not in WORKBOOK_FORMATS:
+        return [
+            _problem(
+                "error",
+                source,
+                MASTER_FILE_PATH,
+                f"Unsupported {label}: expected a workbook, found {file_format}.",
+            )
+            for source in sources
+        ]
+
+    problems = []
+    try:
+        with pd.ExcelFile(
+            MASTER_FILE_PATH, engine=excel_engine(file_format)
+        ) as workbook:
+            for name in names:
+                options = MASTER_SHEETS[name]
+                source = MASTER_SHEET_SOURCES[name]
+                sheet = options["sheet_name"]
+                if isinstance(sheet, int) and sheet >= len(workbook.sheet_names):
+                    problems.append(
+                        _problem(
+                            "error",
+                            source,
+                            MASTER_FILE_PATH,
+                            f"{label} has no sheet #{sheet + 1} ({name}); it has {len(workbook.sheet_names)}.",
+                        )
+                    )
+                    continue
+                header = workbook.parse(
+                    sheet_name=sheet, header=options.get("header", 0), nrows=0
+                ).columns
+                missing = [
+                    column for column in options["usecols"] if column not in header
+                ]
+                if missing:
+                    problems.append(
+                        _problem(
+                            "error",
+                            source,
+                            MASTER_FILE_PATH,
+                            f"Missing column(s) {', '.join(map(repr, missing))} on {label} sheet #{sheet + 1} ({name}).",
+                        )
+                    )
+    except Exception as e:
+        problems.extend(
+            _problem("error", source, MASTER_FILE_PATH, f"Could not read {label}: {e}")
+            for source in sources
+        )
+    return problems
+
+
+def preflight(windows):
+    # Reads only headers and first rows, all inputs at once, so every problem
+    # is reported together before minutes go into parsing.
+    problems = []
+    checks = []
+    for source, (start_date, end_date) in windows.items():
+        schema = INPUT_SCHEMAS.get(source)
+        if schema is None:
+            continue
+        paths = list(
+            dict.fromkeys(
+                schema["path"](day) for day in business_days(start_date, end_date)
+            )
+        )
+        present = [path for path in paths if os.path.exists(path)]
+        if schema.get("daily") and present:
+            problems.extend(
+                _problem(
+                    "warning",
+                    source,
+                    path,
+                    f"{schema['label']} file not found, its day will be skipped.",
+                )
+                for path in paths
+                if path not in present
+            )
+            paths = present
+        checks.extend((check_input, source, path) for path in paths)
+
+    sheets = [
+        name for name, source in MASTER_SHEET_SOURCES.items() if source in windows
+    ]
+    if sheets:
+        checks.append((check_master_sheets, sheets))
+
+    if checks:
+        with ThreadPoolExecutor(max_workers=len(checks)) as pool:
+            futures = [pool.submit(check, *args) for check, *args in checks]
+            for future in futures:
+                problems.extend(future.result())
+
+    errors = [problem for problem in problems if problem["severity"] == "error"]
+    send_message(
+        {
+            "severity": "error" if errors else "warning" if problems else "info",
+            "event": "preflight",
+            "checked": len(checks),
+            "problems": problems,
+        }
+    )
+    record_rows(input_files=len(checks), problems=len(problems))
+    return problems
+
+
+def fetch_all_sources(windows, max_workers=None, engine=ENGINE):
+    try:
+        # Warm the master lookups before forking so workers inherit them.
+        load_master_data()
+    except Exception:
+        pass  # each worker reports its own failure below
+
+    # Polars runs its own thread pool, which does not survive a fork, and
+    # releases the GIL while scanning, so its parse work stays in threads.
+    if engine == "polars":
+        parse_pool = ThreadPoolExecutor(max_workers=max_workers or len(PARSE_SOURCES))
+    else:
+        parse_pool = ProcessPoolExecutor(max_workers=max_workers or len(PARSE_SOURCES))
+
+    results = {}
+    failed_sources = []
+    with parse_pool, ThreadPoolExecutor(max_workers=len(DB_SOURCES)) as thread_pool:
+        # Submit process work first so workers are forked before any thread starts.
+        futures = {
+            parse_pool.submit(
+                run_stage,
+                name,
+                cached_fetch,
+                name,
+                fetcher,
+                *windows[name],
+                *([engine] if name in ENGINE_SOURCES else []),
+            ): name
+            for name, fetcher in PARSE_SOURCES.items()
+            if name in windows
+        }
+        futures.update(
+            {
+                thread_pool.submit(
+                    run_stage, name, cached_fetch, name, fetcher, *windows[name]
+                ): name
+                for name, fetcher in DB_SOURCES.items()
+                if name in windows
+            }
+        )
+
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except (Exception, SystemExit) as e:
+                failed_sources.append(name)
+                send_message(
+                    {"severity": "error", "message": f"{name} source failed: {e!r}"}
+                )
+                continue
+
+            if result is None:
+                failed_sources.append(name)
+                send_message(
+                    {"severity": "error", "message": f"{name} source returned no data."}
+                )
+                continue
+
+            results[name] = result
+
+    return results, failed_sources
+
+
+def open_cube():
+    connection = sqlite3.connect(CUBE_DB_PATH, timeout=30)
+    connection.executescript(
+        """
+        -- Rupee REAL totals from before CUBE_VERSION 2.
+        DROP TABLE IF EXISTS source_totals;
+        CREATE TABLE IF NOT EXISTS store_totals (
+            source TEXT NOT NULL,
+            day TEXT NOT NULL,
+            store TEXT NOT NULL,
+            amount_paise INTEGER NOT NULL,
+            PRIMARY KEY (source, day, store)
+        );
+        CREATE TABLE IF NOT EXISTS terminal_totals (
+            source TEXT NOT NULL,
+            day TEXT NOT NULL,
+            store_key TEXT NOT NULL,
+            store TEXT NOT NULL,
+            terminal TEXT NOT NULL,
+            amount_paise INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            first_row INTEGER,
+            last_row INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS terminal_totals_store
+            ON terminal_totals (day, store_key);
+        CREATE INDEX IF NOT EXISTS terminal_totals_partition
+            ON terminal_totals (source, day);
+        CREATE TABLE IF NOT EXISTS partitions (
+            source TEXT NOT NULL,
+            day TEXT NOT NULL,
+            input_key TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (source, day)
+        );
+        """
+    )
+    return connection
+
+
+def partition_input_key(source, day):
+    # Oracle days are only final once closed; today is always recomputed.
+    if source in DB_SOURCES and day >= pd.Timestamp.today().normalize():
+        return None
+
+    parts = [source, str(CUBE_VERSION)]
+    for path in SOURCE_INPUTS[source](day):
+        try:
+            fingerprint = file_fingerprint(path)
+            parts.append(f"{path}:{fingerprint['size']}:{fingerprint['mtime_ns']}")
+        except FileNotFoundError:
+            parts.append(f"{path}:missing")
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def stale_partitions(connection, start_date, end_date, sources=None, refresh=False):
+    days = business_days(start_date, end_date)
+    stored = {
+        (source, day): input_key
+        for source, day, input_key in connection.execute(
+            "SELECT source, day, input_key FROM partitions WHERE day BETWEEN ? AND ?",
+            (f"{days[0]:%Y-%m-%d}", f"{days[-1]:%Y-%m-%d}"),
+        )
+    }
+
+    stale = {}
+    for source in sources or SOURCE_COLUMNS:
+        for day in days:
+            input_key = partition_input_key(source, day)
+            stored_key = stored.get((source, f"{day:%Y-%m-%d}"))
+            if refresh or input_key is None or stored_key != input_key:
+                stale.setdefault(source, {})[day] = input_key
+    return stale
+
+
+def missing_partitions(connection, start_date, end_date):
+    days = [f"{day:%Y-%m-%d}" for day in business_days(start_date, end_date)]
+    stored = set(
+        connection.execute(
+            "SELECT source, day FROM partitions WHERE day BETWEEN ? AND ?",
+            (days[0], days[-1]),
+        )
+    )
+    missing = {}
+    for source in SOURCE_COLUMNS:
+        for day in days:
+            if (source, day) not in stored:
+                missing.setdefault(source, []).append(day)
+    return missing
+
+
+def terminal_rows(source, detail, days):
+    detail = detail[detail["DATE"].isin(days)]
+    offsets = detail.reindex(columns=["FIRST_ROW", "LAST_ROW"]).astype("Int64")
+    return zip(
+        [source] * len(detail),
+        detail["DATE"].dt.strftime("%Y-%m-%d"),
+        canonical_store_key(detail["STORE"]).tolist(),
+        detail["STORE"].astype(str),
+        detail["TERMINAL"].astype(str),
+        detail["AMOUNT"].astype("int64").tolist(),
+        detail["ROWS"].astype("int64").tolist(),
+        [None if pd.isna(row) else int(row) for row in offsets["FIRST_ROW"]],
+        [None if pd.isna(row) else int(row) for row in offsets["LAST_ROW"]],
+    )
+
+
+def write_cube_partitions(connection, source, frame, input_keys):
+    day_labels = [f"{day:%Y-%m-%d}" for day in input_keys]
+    detail = frame.attrs.get("terminals")
+    frame = frame[frame["DATE"].isin(list(input_keys))]
+    rows = zip(
+        [source] * len(frame),
+        frame["DATE"].dt.strftime("%Y-%m-%d"),
+        frame["STORE"].astype(str),
+        frame[SOURCE_COLUMNS[source]].astype("int64").tolist(),
+    )
+    updated_at = pd.Timestamp.now().isoformat(timespec="seconds")
+
+    with connection:
+        connection.executemany(
+            "DELETE FROM store_totals WHERE source = ? AND day = ?",
+            [(source, day) for day in day_labels],
+        )
+        connection.executemany("INSERT INTO store_totals VALUES (?, ?, ?, ?)", rows)
+        connection.executemany(
+            "DELETE FROM terminal_totals WHERE source = ? AND day = ?",
+            [(source, day) for day in day_labels],
+        )
+        if detail is not None:
+            connection.executemany(
+                "INSERT INTO terminal_totals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                terminal_rows(source, detail, list(input_keys)),
+            )
+        connection.executemany(
+            "INSERT OR REPLACE INTO partitions VALUES (?, ?, ?, ?)",
+            [
+                (source, day, input_key or "", updated_at)
+                for day, input_key in zip(day_labels, input_keys.values())
+            ],
+        )
+
+
+def read_cube(connection, start_date, end_date):
+    frame = pd.read_sql_query(
+        """
+        SELECT source AS SOURCE, store AS STORE, day AS DATE, amount_paise AS AMOUNT
+        FROM store_totals
+        WHERE day BETWEEN ? AND ?
+        """,
+        connection,
+        params=(
+            f"{business_date(start_date):%Y-%m-%d}",
+            f"{business_date(end_date):%Y-%m-%d}",
+        ),
+    )
+    frame["DATE"] = pd.to_datetime(frame["DATE"])
+    frame["STORE"] = frame["STORE"].astype(TEXT_DTYPE)
+    frame["AMOUNT"] = frame["AMOUNT"].astype("int64")
+    return frame
+
+
+def drilldown(store, day):
+    # Terminal-level rows behind one store's reconciled day, straight from
+    # the cube; the FIRST_ROW/LAST_ROW offsets point back into the raw file.
+    store_key = canonical_store_key(pd.Series([store])).iloc[0]
+    connection = open_cube()
+    try:
+        frame = pd.read_sql_query(
+            """
+            SELECT source AS SOURCE, store AS STORE, terminal AS TERMINAL,
+                   amount_paise AS AMOUNT, rows AS ROWS,
+                   first_row AS FIRST_ROW, last_row AS LAST_ROW
+            FROM terminal_totals
+            WHERE day = ? AND store_key = ?
+            ORDER BY source, terminal
+            """,
+            connection,
+            params=(f"{business_date(day):%Y-%m-%d}", store_key),
+        )
+    finally:
+        connection.close()
+    frame["AMOUNT"] = to_rupees(frame["AMOUNT"].astype("int64"))
+    return frame.astype({"FIRST_ROW": "Int64", "LAST_ROW": "Int64"})
+
+
+def refresh_cube(
+    connection,
+    start_date,
+    end_date,
+    max_workers=None,
+    refresh=False,
+    engine=ENGINE,
+    sources=None,
+):
+    stale = stale_partitions(connection, start_date, end_date, sources, refresh)
+    if not stale:
+        return []
+
+    # Each source is fetched once over the span of its stale days.
+    windows = {source: (min(days), max(days)) for source, days in stale.items()}
+    with stage("preflight"):
+        problems = preflight(windows)
+    invalid = {
+        problem["source"] for problem in problems if problem["severity"] == "error"
+    }
+    # The valid sources still reach the cube; only the invalid ones are
+    # left stale, so they are retried next run and this one aborts.
+    windows = {
+        source: window for source, window in windows.items() if source not in invalid
+    }
+    if not windows:
+        return sorted(invalid)
+
+    results, failed_sources = fetch_all_sources(windows, max_workers, engine)
+    for source, frame in results.items():
+        write_cube_partitions(connection, source, frame, stale[source])
+    return sorted(invalid.union(failed_sources))
+
+
+OUTPUT_FORMATS = {
+    "csv": lambda frame, path: frame.to_csv(path, index=False),
+    "parquet": lambda frame, path: frame.to_parquet(
+        path, index=False, engine="pyarrow"
+    ),
+    "arrow": lambda frame, path: frame.reset_index(drop=True).to_feather(path),
+}
+
+
+def output_dir(start_date, end_date):
+    return os.path.join(
+        OUTPUT_DIR,
+        f"{business_date(start_date):%Y-%m-%d}_{business_date(end_date):%Y-%m-%d}",
+    )
+
+
+def atomic_write(path, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _write_text(path, text):
+    with open(path, "w") as handle:
+        handle.write(text)
+
+
+def write_table(frame, directory, name, formats):
+    paths = []
+    for output_format in formats:
+        path = os.path.join(directory, f"{name}.{output_format}")
+        atomic_write(
+            path, lambda tmp_path: OUTPUT_FORMATS[output_format](frame, tmp_path)
+        )
+        paths.append(path)
+    return paths
+
+
+def frame_digest(frame):
+    return hashlib.sha256(
+        pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes()
+    ).hexdigest()
+
+
+def plot_differences(filtered_data, path, headless=False):
+    # The HTML is only re-rendered when the stores with a difference, or their
+    # amounts, changed since it was last written; an interactive run still
+    # shows the chart.
+    digest_path = f"{path}.sha256"
+    digest = frame_digest(filtered_data)
+    unchanged = False
+    if os.path.exists(path) and os.path.exists(digest_path):
+        with open(digest_path) as handle:
+            unchanged = handle.read() == digest
+    if unchanged and headless:
+        return
+
+    import plotly.express as px
+
+    custom_template = {
+        "layout": {
+            "paper_bgcolor": "rgb(255, 255, 224)",
+            "plot_bgcolor": "rgb(255, 255, 224)",
+        }
+    }
+
+    fig = px.bar(
+        filtered_data,
+        x="STORE",
+        y="Difference",
+        title="Difference in Sale Reconciliation",
+        text="Difference",
+        hover_data=["DATE"],
+    )
+
+    fig.update_traces(
+        marker_color=[
+            f"rgba( 255, 108, 108, 0.6)"
+            if diff < 0
+            else f"rgba( 150, 232, 109  0.6)"
+            for diff in filtered_data["Difference"]
+        ]
+    )
+    fig.update_layout(xaxis_title="Store", yaxis_title="Difference")
+
+    fig.update_layout(bargap=0.7)
+
+    fig.update_layout(template=custom_template)
+
+    if not headless:
+        fig.show()
+
+    if not unchanged:
+        atomic_write(path, fig.write_html)
+        atomic_write(digest_path, lambda tmp_path: _write_text(tmp_path, digest))
+
+
+def canonical_store_key(stores):
+    keys = stores.astype(TEXT_DTYPE).str.upper()
+    return keys.str.replace(r"[^0-9A-Z]+", " ", regex=True).str.strip()
+
+
+def build_store_dimension(stores, sources):
+    # Ginesys site names win over the free-text master sheet spellings.
+    priority = sources.map(
+        {source: rank for rank, source in enumerate(STORE_NAME_PRIORITY)}
+    ).fillna(len(STORE_NAME_PRIORITY))
+    candidates = pd.DataFrame(
+        {"STORE_KEY": canonical_store_key(stores), "STORE": stores, "RANK": priority}
+    )
+    dimension = (
+        candidates.sort_values(["RANK", "STORE"], kind="stable")
+        .drop_duplicates("STORE_KEY")
+        .set_index("STORE_KEY")["STORE"]
+    )
+    return candidates["STORE_KEY"], dimension
+
+
+def combine_sources(totals):
+    with stage("combine sources"):
+        store_keys, dimension = build_store_dimension(totals["STORE"], totals["SOURCE"])
+        stores = store_keys.map(dimension)
+        combined = (
+            pd.DataFrame(
+                {
+                    "STORE": pd.Categorical(stores, categories=sorted(dimension.unique())),
+                    "DATE": totals["DATE"],
+                    "COLUMN": totals["SOURCE"].map(SOURCE_COLUMNS),
+                    "AMOUNT": totals["AMOUNT"],
+                }
+            )
+            .groupby(["STORE", "DATE", "COLUMN"], observed=True)["AMOUNT"]
+            .sum()
+            .unstack("COLUMN")
+            .reindex(columns=list(SOURCE_COLUMNS.values()))
+            .astype("Int64")
+            .rename_axis(columns=None)
+            .reset_index()
+        )
+        record_rows(
+            input_rows=len(totals),
+            joined_rows=len(combined),
+            merged_store_spellings=totals["STORE"].nunique() - len(dimension),
+        )
+        return combined
+
+
+def history_path(day):
+    return os.path.join(HISTORY_DIR, f"differences_{day:%Y-%m-%d}.parquet")
+
+
+def append_history(merged_data):
+    # A run covers every store for its days, so each day's file is replaced
+    # whole; runs for other days never rewrite it.
+    history = merged_data.assign(STORE=merged_data["STORE"].astype(TEXT_DTYPE))
+    for day, rows in history.groupby("DATE"):
+        rows = rows.sort_values("STORE", ignore_index=True)
+        atomic_write(
+            history_path(day),
+            lambda tmp_path: rows.to_parquet(tmp_path, index=False, engine="pyarrow"),
+        )
+        record_rows(output_rows=len(rows))
+
+
+def load_history(start_date, end_date):
+    import pyarrow.dataset as ds
+
+    paths = [
+        history_path(day)
+        for day in business_days(start_date, end_date)
+        if os.path.exists(history_path(day))
+    ]
+    if not paths:
+        return pd.DataFrame(columns=["STORE", "DATE", "Difference"])
+    history = ds.dataset(paths, format="parquet").to_table(
+        columns=["STORE", "DATE", "Difference"]
+    )
+    return history.to_pandas().astype({"STORE": TEXT_DTYPE})
+
+
+def _rolling_stats(values, window, min_periods):
+    # Mean and sample std of the trailing window at every cell of a day x
+    # store matrix, over a strided view instead of one loop per store.
+    padded = np.vstack([np.full((window - 1, values.shape[1]), np.nan), values])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=0)
+    count = (~np.isnan(windows)).sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nansum(windows, axis=-1) / count
+        variance = np.nansum((windows - mean[..., None]) ** 2, axis=-1) / (count - 1)
+    enough = count >= min_periods
+    return np.where(enough, mean, np.nan), np.where(enough, np.sqrt(variance), np.nan)
+
+
+def difference_trends(
+    history, window=HISTORY_WINDOW_DAYS, z_threshold=ANOMALY_Z_SCORE
+):
+    # One row per calendar day and one column per store; days a store was not
+    # reconciled stay NaN. History holds each (STORE, DATE) once.
+    store_index, stores = pd.factorize(history["STORE"], sort=True)
+    stores = np.asarray(stores, dtype=object)
+    first_day = history["DATE"].min()
+    day_index = (history["DATE"] - first_day).dt.days.to_numpy()
+    days = pd.date_range(first_day, periods=day_index.max() + 1, freq="D")
+    values = np.full((len(days), len(stores)), np.nan)
+    values[day_index, store_index] = history["Difference"].to_numpy("float64")
+
+    rolling_mean, rolling_std = _rolling_stats(values, window, min_periods=2)
+    # A day is scored against the full window before it, so a spike cannot
+    # hide in its own baseline. Flat baselines have no z-score; leaving zero
+    # shows up in NONZERO_STREAK instead.
+    previous = np.vstack([np.full((1, len(stores)), np.nan), values[:-1]])
+    baseline_mean, baseline_std = _rolling_stats(previous, window, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z_score = (values - baseline_mean) / np.where(
+            baseline_std > 0, baseline_std, np.nan
+        )
+
+    # Consecutive non-zero days up to each day: the running count of non-zero
+    # days minus its value at the last zero day.
+    nonzero = np.nan_to_num(values) != 0
+    nonzero_days = nonzero.cumsum(axis=0)
+    streak = nonzero_days - np.maximum.accumulate(
+        np.where(nonzero, 0, nonzero_days), axis=0
+    )
+
+    # Transposed so the rows come out ordered by store, then date.
+    store_rows, day_rows = np.nonzero(~np.isnan(values.T))
+    trends = pd.DataFrame(
+        {
+            "STORE": pd.array(stores[store_rows], dtype=TEXT_DTYPE),
+            "DATE": days[day_rows],
+            "Difference": to_rupees(values.T[store_rows, day_rows]),
+            "ROLLING_MEAN": to_rupees(rolling_mean.T[store_rows, day_rows]),
+            "ROLLING_STD": to_rupees(rolling_std.T[store_rows, day_rows]),
+            "Z_SCORE": z_score.T[store_rows, day_rows],
+            "NONZERO_STREAK": streak.T[store_rows, day_rows].astype("int64"),
+        }
+    )
+    trends["ANOMALY"] = trends["Z_SCORE"].abs() >= z_threshold
+    return trends
+
+
+def generate_csv(
+    start_date=DEFAULT_BUSINESS_DATE,
+    end_date=DEFAULT_BUSINESS_DATE,
+    max_workers=None,
+    refresh=False,
+    headless=False,
+    formats=("csv",),
+    chart=True,
+    engine=ENGINE,
+    sources=None,
+):
+    connection = open_cube()
+    try:
+        with stage("refresh cube"):
+            failed_sources = refresh_cube(
+                connection, start_date, end_date, max_workers, refresh, engine, sources
+            )
+        if failed_sources:
+            send_message(
+                {
+                    "severity": "error",
+                    "message": f"Reconciliation aborted, failed source(s): {', '.join(failed_sources)}.",
+                }
+            )
+            return None
+
+        with stage("read cube"):
+            totals = read_cube(connection, start_date, end_date)
+            record_rows(input_rows=len(totals))
+        # Sources never fetched for a day (e.g. left out of a sources= run)
+        # would read as zero, so such an output is reported as partial.
+        missing = missing_partitions(connection, start_date, end_date)
+    finally:
+        connection.close()
+
+    keys = ["STORE", "DATE"]
+    merged_data = combine_sources(totals)
+
+    merged_data["total_CC_recd"] = merged_data[
+        ["SBI_total_amt", "hdfc_total_amt", "BAJAJ_total_amt", "Paytm_total_amt"]
+    ].sum(axis=1)
+
+    merged_data["Difference"] = (
+        merged_data["total_ginesys_advance"] + merged_data["total_ginesys_new"]
+    ) - merged_data["total_CC_recd"]
+
+    amount_columns = list(SOURCE_COLUMNS.values()) + ["total_CC_recd", "Difference"]
+    merged_data[amount_columns] = merged_data[amount_columns].fillna(0).astype("int64")
+
+    merged_data = merged_data[
+        [
+            "STORE",
+            "DATE",
+            "total_ginesys_advance",
+            "total_ginesys_new",
+            "SBI_total_amt",
+            "hdfc_total_amt",
             "BAJAJ_total_amt",
             "Paytm_total_amt",
             "total_CC_recd",
             "Difference",
         ]
-    ]
+    ].sort_values(keys, ignore_index=True)
+    try:
+        with stage("append history"):
+            append_history(merged_data)
+    except Exception as e:
+        send_message(
+            {"severity": "warning", "message": f"Could not update history: {e}"}
+        )
+    merged_data["DATE"] = merged_data["DATE"].dt.strftime("%Y-%m-%d")
 
-    differences = merged_data[merged_data["Difference"] != 0]["Difference"].tolist()
+    # Differences are decided on exact paise; outputs are in rupees.
+    has_difference = merged_data["Difference"] != 0
+    merged_data[amount_columns] = to_rupees(merged_data[amount_columns])
 
-    if differences:
-        filtered_data = merged_data[merged_data["Difference"] != 0]
+    directory = output_dir(start_date, end_date)
+    filtered_data = merged_data[has_difference]
+    if filtered_data.empty:
+        print("No differences found in the 'Difference' column.")
+    elif chart:
+        plot_differences(
+            filtered_data, os.path.join(directory, GRAPH_HTML_NAME), headless
+        )
 
-        custom_template = {
-            "layout": {
-                "paper_bgcolor": "rgb(255, 255, 224)",
-                "plot_bgcolor": "rgb(255, 255, 224)",
+    try:
+        paths = write_table(merged_data, directory, OUTPUT_NAME, formats)
+    except Exception as e:
+        send_message(
+            {"severity": "error", "message": f"Error writing output: {str(e)}"}
+        )
+        return None
+
+    if missing:
+        send_message(
+            {
+                "severity": "warning",
+                "event": "partial",
+                "message": "Output files have been generated, but some sources have no totals for part of the range.",
+                "missing": missing,
+                "paths": paths,
             }
+        )
+        return merged_data
+
+    send_message(
+        {
+            "severity": "success",
+            "message": "Output files have been generated successfully.",
+            "paths": paths,
+        }
+    )
+    return merged_data
+
+
+def fetch_pos_lines(start_date=DEFAULT_BUSINESS_DATE, end_date=DEFAULT_BUSINESS_DATE):
+    columns = ["BILL_REF", "STORE", "MOPDESC", "BILLDATE", "BASEAMT"]
+    lines = extract_ginesys(GINESYS_POS_LINES_SQL, columns, start_date, end_date)
+    times = pd.to_datetime(lines["BILLDATE"]).astype("datetime64[ns]")
+    record_rows(input_rows=len(lines))
+    return pd.DataFrame(
+        {
+            "BILL_REF": lines["BILL_REF"].astype(str).astype(TEXT_DTYPE),
+            "STORE": lines["STORE"].astype(TEXT_DTYPE),
+            "MOPDESC": lines["MOPDESC"].astype(TEXT_DTYPE),
+            "TIME": times,
+            "DATE": times.dt.normalize(),
+            "AMOUNT_PAISE": to_paise(pd.to_numeric(lines["BASEAMT"])),
+        }
+    )
+
+
+def acquirer_lines(source, rows, key_column, paise, master, master_key, master_store):
+    stores = master.drop_duplicates(master_key).set_index(master_key)[master_store]
+    lines = pd.DataFrame(
+        {
+            "SOURCE": pd.Categorical(
+                [source] * len(rows), categories=list(ACQUIRER_LINES)
+            ),
+            "ROW": rows.index,
+            "TERMINAL": rows[key_column],
+            "STORE": rows[key_column].map(stores).astype(TEXT_DTYPE),
+            "MOPDESC": pd.Series(
+                ACQUIRER_MOPS[source], index=rows.index, dtype=TEXT_DTYPE
+            ),
+            "TIME": rows["TIME"].astype("datetime64[ns]"),
+            "DATE": rows["DATE"].astype("datetime64[ns]"),
+            "AMOUNT_PAISE": paise,
+        }
+    )
+    unmatched = lines["STORE"].isna()
+    record_rows(
+        joined_rows=(~unmatched).sum(),
+        unmatched_keys=lines.loc[unmatched, "TERMINAL"].nunique(),
+    )
+    return lines.reset_index(drop=True)
+
+
+def _concat_rows(chunks, key_column, amount_column):
+    if chunks:
+        return pd.concat(chunks)
+    return pd.DataFrame(
+        {
+            key_column: pd.Series(dtype=object),
+            "TIME": pd.Series(dtype="datetime64[ns]"),
+            "DATE": pd.Series(dtype="datetime64[ns]"),
+            amount_column: pd.Series(dtype=float),
         }
+    )
+
+
+def sbi_lines(start_date, end_date):
+    rows = _concat_rows(
+        list(
+            iter_csv_rows(
+                SBI_CSV_PATH,
+                "TID",
+                "Tran Date",
+                "Net Amount",
+                pd.to_datetime,
+                normalize_amount,
+                start_date,
+                end_date,
+            )
+        ),
+        "TID",
+        "Net Amount",
+    )
+    return acquirer_lines(
+        "SBI",
+        rows,
+        "TID",
+        rows["Net Amount"],
+        get_master_sheet("sbi_tid"),
+        "TID",
+        "LOCATION NAME",
+    )
 
-        fig = px.bar(
-            filtered_data,
-            x="STORE",
-            y="Difference",
-            title="Difference in Sale Reconciliation",
-            text="Difference",
+
+def hdfc_lines(start_date, end_date):
+    rows = read_daily_files(
+        hdfc_file_path,
+        read_hdfc_settlement,
+        start_date,
+        end_date,
+        "HDFC settlement",
+    ).set_index("ROW")
+    rows["TERMINAL NUMBER"] = clean_key(rows["TERMINAL NUMBER"])
+    rows["TIME"] = rows["DATE"]
+    paise = to_paise(normalize_amount(rows["DOMESTIC AMT"])) + to_paise(
+        normalize_amount(rows["INTNL AMT"])
+    )
+    return acquirer_lines(
+        "HDFC",
+        rows,
+        "TERMINAL NUMBER",
+        paise,
+        get_master_sheet("hdfc_tid"),
+        "HDFC TID",
+        "Store Locations",
+    )
+
+
+def bajaj_lines(start_date, end_date):
+    rows = read_workbook(bajaj_ledger_path(), columns=BAJAJ_COLUMNS)
+    rows["Supplier ID"] = clean_key(rows["Supplier ID"])
+    rows["DATE"] = pd.to_datetime(
+        rows["Invoice Date"].str.replace("'", ""), format="%d/%m/%Y"
+    )
+    rows = rows[
+        rows["DATE"].between(business_date(start_date), business_date(end_date))
+    ].assign(TIME=lambda frame: frame["DATE"])
+    return acquirer_lines(
+        "Bajaj",
+        rows,
+        "Supplier ID",
+        to_paise(normalize_amount(rows["Invoice Amt"])),
+        get_master_sheet("bfl_dealer"),
+        "BFL\nDEALER CODE",
+        "Store name",
+    )
+
+
+def paytm_lines(start_date, end_date):
+    rows = _concat_rows(
+        list(
+            iter_csv_rows(
+                PAYTM_CSV_PATH,
+                "original_mid",
+                "transaction_date",
+                "amount",
+                parse_paytm_times,
+                normalize_amount,
+                start_date,
+                end_date,
+                encoding="ISO-8859-1",
+            )
+        ),
+        "original_mid",
+        "amount",
+    )
+    return acquirer_lines(
+        "Paytm",
+        rows,
+        "original_mid",
+        rows["amount"],
+        get_master_sheet("paytm_mid"),
+        "Production Mid",
+        "LOCATION",
+    )
+
+
+ACQUIRER_LINES = {
+    "SBI": sbi_lines,
+    "HDFC": hdfc_lines,
+    "Bajaj": bajaj_lines,
+    "Paytm": paytm_lines,
+}
+
+# Bump when transaction_keys() changes; keys of another version cannot be
+# compared, so the index starts over.
+TRANSACTION_INDEX_VERSION = 2
+
+
+def open_transaction_index():
+    connection = sqlite3.connect(TRANSACTION_INDEX_PATH, timeout=30)
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        (version,) = connection.execute("PRAGMA user_version").fetchone()
+        if version != TRANSACTION_INDEX_VERSION:
+            for table in ["transactions", "duplicates", "deliveries"]:
+                connection.execute(f"DROP TABLE IF EXISTS {table}")
+            connection.execute(f"PRAGMA user_version = {TRANSACTION_INDEX_VERSION}")
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        connection.close()
+        raise
+    connection.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            source TEXT NOT NULL,
+            identity INTEGER NOT NULL,
+            slot INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            terminal TEXT NOT NULL,
+            amount_paise INTEGER NOT NULL,
+            delivery TEXT NOT NULL,
+            PRIMARY KEY (source, identity)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS transactions_day ON transactions (source, day);
+        -- Repeats of a transaction already counted earlier in the same file.
+        CREATE TABLE IF NOT EXISTS duplicates (
+            source TEXT NOT NULL,
+            delivery TEXT NOT NULL,
+            day TEXT NOT NULL,
+            terminal TEXT NOT NULL,
+            row INTEGER NOT NULL,
+            amount_paise INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS duplicates_delivery
+            ON duplicates (source, delivery, day);
+        CREATE TABLE IF NOT EXISTS deliveries (
+            source TEXT NOT NULL,
+            delivery TEXT NOT NULL,
+            day TEXT NOT NULL,
+            path TEXT NOT NULL,
+            ingested_at TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            new_rows INTEGER NOT NULL,
+            redelivered INTEGER NOT NULL,
+            duplicates INTEGER NOT NULL,
+            corrections INTEGER NOT NULL,
+            PRIMARY KEY (source, delivery, day)
+        );
+        CREATE TABLE IF NOT EXISTS file_hashes (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT NOT NULL
+        );
+        """
+    )
+    return connection
+
+
+def _hash_rows(columns):
+    return pd.util.hash_pandas_object(columns, index=False).to_numpy().view("int64")
+
+
+def transaction_reference(source, columns):
+    candidates = TRANSACTION_REFERENCES.get(source, [])
+    return next((column for column in candidates if column in columns), None)
+
+
+def transaction_keys(source, lines):
+    # A card transaction is its terminal, timestamp, amount and acquirer
+    # reference; its slot (all but the amount) is what a corrected amount
+    # keeps. Without a reference, equal payments in the same second look like
+    # repeats, which are then only reported. Date-only sources cannot tell
+    # equal payments apart at all, so their key counts repeats within the file
+    # and a correction cannot be recognised.
+    if "REFERENCE" in lines:
+        identity = _hash_rows(
+            lines[["TERMINAL", "TIME", "AMOUNT_PAISE", "REFERENCE"]]
+        )
+        slot = _hash_rows(lines[["TERMINAL", "TIME", "REFERENCE"]])
+    elif source in TIMESTAMPED_SOURCES:
+        identity = _hash_rows(lines[["TERMINAL", "TIME", "AMOUNT_PAISE"]])
+        slot = _hash_rows(lines[["TERMINAL", "TIME"]])
+    else:
+        columns = lines[["TERMINAL", "DATE", "AMOUNT_PAISE"]]
+        identity = slot = _hash_rows(
+            columns.assign(OCCURRENCE=columns.groupby(list(columns)).cumcount())
         )
+    return identity, slot
 
-        fig.update_traces(
-            marker_color=[
-                f"rgba( 255, 108, 108, 0.6)"
-                if diff < 0
-                else f"rgba( 150, 232, 109  0.6)"
-                for diff in filtered_data["Difference"]
-            ]
+
+def _ingest_delivery(connection, source, delivery, path, lines, days):
+    identity, slot = transaction_keys(source, lines)
+    lines = lines.assign(
+        IDENTITY=identity, SLOT=slot, DAY=lines["DATE"].dt.strftime("%Y-%m-%d")
+    )
+    repeated = lines.duplicated("IDENTITY")
+    duplicates, unique = lines[repeated], lines[~repeated]
+
+    known = pd.read_sql_query(
+        f"""
+        SELECT identity AS IDENTITY, slot AS SLOT
+        FROM transactions
+        WHERE source = ? AND day IN ({", ".join("?" * len(days))})
+        """,
+        connection,
+        params=[source, *days],
+    )
+    new = ~unique["IDENTITY"].isin(known["IDENTITY"])
+    # A known slot whose old amount this delivery no longer has was corrected.
+    replaced = known[
+        known["SLOT"].isin(unique.loc[new, "SLOT"])
+        & ~known["IDENTITY"].isin(unique["IDENTITY"])
+    ]
+    corrected = new & unique["SLOT"].isin(replaced["SLOT"])
+    inserted = unique[new]
+
+    counts = (
+        pd.DataFrame(
+            {
+                "rows": lines.groupby("DAY").size(),
+                "new_rows": new.groupby(unique["DAY"]).sum(),
+                "redelivered": (~new).groupby(unique["DAY"]).sum(),
+                "duplicates": duplicates.groupby("DAY").size(),
+                "corrections": corrected.groupby(unique["DAY"]).sum(),
+            }
         )
-        fig.update_layout(xaxis_title="Store", yaxis_title="Difference")
+        .reindex(days)
+        .fillna(0)
+        .astype("int64")
+    )
 
-        fig.update_layout(bargap=0.7)
+    ingested_at = pd.Timestamp.now().isoformat(timespec="seconds")
+    with connection:
+        connection.executemany(
+            "DELETE FROM transactions WHERE source = ? AND identity = ?",
+            [(source, int(old)) for old in replaced["IDENTITY"]],
+        )
+        connection.executemany(
+            "INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            zip(
+                [source] * len(inserted),
+                inserted["IDENTITY"].tolist(),
+                inserted["SLOT"].tolist(),
+                inserted["DAY"],
+                inserted["TERMINAL"].astype(str),
+                inserted["AMOUNT_PAISE"].tolist(),
+                [delivery] * len(inserted),
+            ),
+        )
+        connection.executemany(
+            "INSERT INTO duplicates VALUES (?, ?, ?, ?, ?, ?)",
+            zip(
+                [source] * len(duplicates),
+                [delivery] * len(duplicates),
+                duplicates["DAY"],
+                duplicates["TERMINAL"].astype(str),
+                duplicates["ROW"].tolist(),
+                duplicates["AMOUNT_PAISE"].tolist(),
+            ),
+        )
+        connection.executemany(
+            "INSERT OR REPLACE INTO deliveries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (source, delivery, day, path, ingested_at, *map(int, row))
+                for day, row in zip(days, counts.itertuples(index=False))
+            ],
+        )
+    return {name: int(total) for name, total in counts.sum().items()}
 
-        fig.update_layout(template=custom_template)
 
-        fig.show()
+def transaction_deliveries(source, start_date, end_date):
+    # The file version (delivery) behind each day, and the days whose delivery
+    # is not in the index yet; only those need their rows keyed.
+    connection = open_transaction_index()
+    try:
+        deliveries = {}
+        for day in business_days(start_date, end_date):
+            path = INPUT_SCHEMAS[source]["path"](day)
+            if os.path.exists(path):
+                deliveries[f"{day:%Y-%m-%d}"] = (path, input_digest(connection, path))
+
+        ingested = set(
+            connection.execute(
+                "SELECT delivery, day FROM deliveries WHERE source = ?", (source,)
+            )
+        )
+    finally:
+        connection.close()
 
-        fig.write_html(
-            "/home/savyasachi/Downloads/Graphs_Sale_Reconciliation/difference_bar_plot.html"
+    pending = [
+        day
+        for day, (path, delivery) in deliveries.items()
+        if (delivery, day) not in ingested
+    ]
+    return deliveries, pending
+
+
+def dedupe_transactions(source, deliveries, pending, lines, reference=None):
+    # lines are the pending days' rows, keyed by the fetcher in the same pass
+    # that computes its totals. Each delivery is ingested into the index once
+    # per day; afterwards only its duplicate rows are read back, for the
+    # fetcher to leave out of its totals when the source has a reference.
+    if lines is None:
+        lines = pd.DataFrame(
+            {
+                "ROW": pd.Series(dtype="int64"),
+                "TERMINAL": pd.Series(dtype=TEXT_DTYPE),
+                "TIME": pd.Series(dtype="datetime64[ns]"),
+                "DATE": pd.Series(dtype="datetime64[ns]"),
+                "AMOUNT_PAISE": pd.Series(dtype="int64"),
+            }
         )
-        try:
-            merged_data.to_csv(
-                "/home/savyasachi/Downloads/Automation_Store_Sale_Reconciliation/merged_data_final.csv",
-                index=False,
-            )
+    connection = open_transaction_index()
+    try:
+        by_delivery = {}
+        for day in pending:
+            by_delivery.setdefault(deliveries[day], []).append(day)
+
+        for (path, delivery), days in by_delivery.items():
+            with stage(f"dedupe {source}"):
+                day_lines = lines[lines["DATE"].isin(pd.to_datetime(days))]
+                counts = _ingest_delivery(
+                    connection, source, delivery, path, day_lines, days
+                )
+                record_rows(input_rows=counts["rows"], new_rows=counts["new_rows"])
             send_message(
                 {
-                    "severity": "success",
-                    "message": "CSV file has been generated successfully.",
+                    "severity": "warning"
+                    if counts["duplicates"] or counts["corrections"]
+                    else "info",
+                    "event": "dedupe",
+                    "source": source,
+                    "path": path,
+                    "days": days,
+                    "reference": reference,
+                    **counts,
                 }
             )
+
+        duplicates = []
+        if reference:
+            duplicates = [
+                pd.read_sql_query(
+                    """
+                    SELECT terminal AS TERMINAL, day AS DATE, row AS ROW,
+                           amount_paise AS AMOUNT_PAISE
+                    FROM duplicates
+                    WHERE source = ? AND delivery = ? AND day = ?
+                    """,
+                    connection,
+                    params=(source, delivery, day),
+                )
+                for day, (path, delivery) in deliveries.items()
+            ]
+    finally:
+        connection.close()
+
+    duplicates = [frame for frame in duplicates if not frame.empty]
+    if not duplicates:
+        return pd.DataFrame(columns=["TERMINAL", "DATE", "ROW", "AMOUNT_PAISE"])
+    return pd.concat(duplicates, ignore_index=True).astype(
+        {"TERMINAL": TEXT_DTYPE, "DATE": "datetime64[ns]", "AMOUNT_PAISE": "int64"}
+    )
+
+
+def drop_duplicates(totals, key_column, amount_column, duplicates):
+    # Takes repeated transactions back out of (key, DATE) totals.
+    if duplicates.empty:
+        return totals
+    removed = duplicates.groupby(["TERMINAL", "DATE"]).agg(
+        REMOVED_PAISE=("AMOUNT_PAISE", "sum"), REMOVED_ROWS=("ROW", "size")
+    )
+    removed.index.names = [key_column, "DATE"]
+    adjusted = totals.join(removed, on=[key_column, "DATE"])
+    adjusted[amount_column] -= adjusted["REMOVED_PAISE"].fillna(0).astype("int64")
+    adjusted["ROWS"] -= adjusted["REMOVED_ROWS"].fillna(0).astype("int64")
+    return adjusted.drop(columns=["REMOVED_PAISE", "REMOVED_ROWS"])
+
+
+MATCH_KEYS = ["STORE_KEY", "MOPDESC", "AMOUNT_PAISE"]
+EXCEPTION_TABLES = ["unmatched_pos", "unmatched_acquirer", "many_to_one"]
+
+
+def _claim_nearest(lines, bills, tolerance):
+    # Every line claims the nearest bill with the same store, MOP and amount; a
+    # bill claimed more than once goes to the closest line.
+    claims = pd.merge_asof(
+        lines.sort_values("TIME"),
+        bills.sort_values("POS_TIME"),
+        left_on="TIME",
+        right_on="POS_TIME",
+        by=MATCH_KEYS,
+        direction="nearest",
+        tolerance=tolerance,
+    ).dropna(subset=["BILL_REF"])
+    claims["GAP"] = (claims["TIME"] - claims["POS_TIME"]).abs()
+    winners = claims.sort_values(["GAP", "LINE_ID"]).drop_duplicates("BILL_REF")
+    return claims[["LINE_ID", "BILL_REF"]], winners[["LINE_ID", "BILL_REF"]]
+
+
+def _match_timestamped(lines, bills, tolerance):
+    pairs, first_claims = [], []
+    for _ in range(MATCH_ROUNDS):
+        if lines.empty or bills.empty:
+            break
+        claims, winners = _claim_nearest(lines, bills, tolerance)
+        if winners.empty:
+            break
+        first_claims.append(claims)
+        pairs.append(winners)
+        lines = lines[~lines["LINE_ID"].isin(winners["LINE_ID"])]
+        bills = bills[~bills["BILL_REF"].isin(winners["BILL_REF"])]
+
+    if not pairs:
+        return pd.DataFrame(columns=["LINE_ID", "BILL_REF"]), pd.DataFrame(
+            columns=["LINE_ID", "BILL_REF"]
+        )
+    contested = pd.concat(first_claims).drop_duplicates("LINE_ID")
+    contested = contested[contested["LINE_ID"].isin(lines["LINE_ID"])]
+    return pd.concat(pairs, ignore_index=True), contested
+
+
+def _match_by_day(lines, bills):
+    # Without a time of day the n-th line of a store/MOP/amount/day pairs with
+    # the n-th bill of that day, as a hash join on the occurrence number.
+    day_keys = MATCH_KEYS + ["DATE"]
+    lines = lines.sort_values("LINE_ID")
+    bills = bills.rename(columns={"POS_DATE": "DATE"}).sort_values("POS_TIME")
+    lines = lines.assign(OCCURRENCE=lines.groupby(day_keys).cumcount())
+    bills = bills.assign(OCCURRENCE=bills.groupby(day_keys).cumcount())
+
+    pairs = lines.merge(bills, on=day_keys + ["OCCURRENCE"])[["LINE_ID", "BILL_REF"]]
+    leftover = lines[~lines["LINE_ID"].isin(pairs["LINE_ID"])]
+    contested = leftover.merge(
+        bills.drop_duplicates(day_keys, keep="last"), on=day_keys
+    )[["LINE_ID", "BILL_REF"]]
+    return pairs, contested
+
+
+def match_transactions(pos, acquirer, tolerance):
+    bills = pos.rename(
+        columns={"STORE": "POS_STORE", "TIME": "POS_TIME", "DATE": "POS_DATE"}
+    ).assign(STORE_KEY=canonical_store_key(pos["STORE"]))
+    lines = acquirer.assign(
+        LINE_ID=np.arange(len(acquirer)),
+        STORE_KEY=canonical_store_key(acquirer["STORE"]),
+    )
+    mapped = lines["STORE"].notna()
+    timestamped = lines["SOURCE"].isin(TIMESTAMPED_SOURCES)
+    bill_columns = ["BILL_REF", "POS_TIME", "POS_DATE"] + MATCH_KEYS
+
+    # Exact timestamps are matched first so they take the bills they belong to.
+    pairs, contested = _match_timestamped(
+        lines.loc[mapped & timestamped, ["LINE_ID", "TIME"] + MATCH_KEYS],
+        bills[bill_columns],
+        tolerance,
+    )
+    day_pairs, day_contested = _match_by_day(
+        lines.loc[mapped & ~timestamped, ["LINE_ID", "DATE"] + MATCH_KEYS],
+        bills.loc[~bills["BILL_REF"].isin(pairs["BILL_REF"]), bill_columns],
+    )
+    pairs = pd.concat([pairs, day_pairs], ignore_index=True)
+    contested = pd.concat([contested, day_contested], ignore_index=True)
+
+    bill_details = bills[["BILL_REF", "POS_STORE", "POS_TIME"]]
+    line_columns = list(acquirer.columns) + ["LINE_ID"]
+    matched = lines[line_columns].merge(pairs, on="LINE_ID").merge(
+        bill_details, on="BILL_REF"
+    )
+
+    # Lines that lost their bill to another line, next to the line that kept it.
+    duplicates = lines[line_columns].merge(contested, on="LINE_ID")
+    winners = matched[matched["BILL_REF"].isin(contested["BILL_REF"])]
+    many_to_one = (
+        pd.concat(
+            [
+                winners.drop(columns=["POS_STORE", "POS_TIME"]).assign(
+                    STATUS="matched"
+                ),
+                duplicates.assign(STATUS="duplicate"),
+            ],
+            ignore_index=True,
+        )
+        .merge(bill_details, on="BILL_REF")
+        .sort_values(
+            ["BILL_REF", "STATUS", "TIME"],
+            ascending=[True, False, True],
+            ignore_index=True,
+        )
+    )
+
+    unmatched_acquirer = lines.loc[
+        ~lines["LINE_ID"].isin(pairs["LINE_ID"])
+        & ~lines["LINE_ID"].isin(contested["LINE_ID"]),
+        line_columns,
+    ]
+    unmatched_acquirer["REASON"] = np.where(
+        unmatched_acquirer["STORE"].notna(), "no POS bill", "unknown terminal"
+    )
+    unmatched_pos = pos[~pos["BILL_REF"].isin(pairs["BILL_REF"])]
+
+    return {
+        "matched": matched.drop(columns="LINE_ID"),
+        "many_to_one": many_to_one.drop(columns="LINE_ID"),
+        "unmatched_acquirer": unmatched_acquirer.drop(columns="LINE_ID").reset_index(
+            drop=True
+        ),
+        "unmatched_pos": unmatched_pos.reset_index(drop=True),
+    }
+
+
+def write_exception_tables(results, start_date, end_date, formats=("csv",)):
+    directory = output_dir(start_date, end_date)
+    for name in EXCEPTION_TABLES:
+        write_table(results[name], directory, name, formats)
+    return directory
+
+
+def match_range(
+    start_date=DEFAULT_BUSINESS_DATE,
+    end_date=DEFAULT_BUSINESS_DATE,
+    tolerance_minutes=MATCH_TOLERANCE_MINUTES,
+    formats=("csv",),
+):
+    frames, failed_sources = [], []
+    for source, loader in ACQUIRER_LINES.items():
+        try:
+            frames.append(run_stage(f"{source} lines", loader, start_date, end_date))
         except Exception as e:
             send_message(
-                {"severity": "error", "message": f"Error generating CSV: {str(e)}"}
+                {"severity": "error", "message": f"{source} lines failed: {e}"}
             )
+            failed_sources.append(source)
+    try:
+        pos = run_stage("Ginesys POS lines", fetch_pos_lines, start_date, end_date)
+    except Exception as e:
+        send_message({"severity": "error", "message": f"Ginesys POS lines failed: {e}"})
+        failed_sources.append("Ginesys POS")
+
+    if failed_sources:
+        send_message(
+            {
+                "severity": "error",
+                "message": f"Transaction matching aborted, failed source(s): {', '.join(failed_sources)}.",
+            }
+        )
+        return None
+
+    with stage("match transactions"):
+        acquirer = pd.concat(frames, ignore_index=True)
+        results = match_transactions(
+            pos, acquirer, pd.Timedelta(minutes=tolerance_minutes)
+        )
+        record_rows(
+            input_rows=len(acquirer) + len(pos),
+            joined_rows=len(results["matched"]),
+            **{name: len(results[name]) for name in EXCEPTION_TABLES},
+        )
+
+    directory = write_exception_tables(results, start_date, end_date, formats)
+    send_message(
+        {
+            "severity": "success",
+            "message": "Transaction matching complete.",
+            "matched": len(results["matched"]),
+            **{name: len(results[name]) for name in EXCEPTION_TABLES},
+            "output_dir": directory,
+        }
+    )
+    return results
 
-    else:
-        print("No differences found in the 'Difference' column.")
 
-    merged_data.to_csv(
-        "/home/savyasachi/Downloads/Automation_Store_Sale_Reconciliation/merged_data_final.csv",
-        index=False,
+def watched_inputs(start_date, end_date):
+    inputs = {}
+    for source in PARSE_SOURCES:
+        for day in business_days(start_date, end_date):
+            for path in SOURCE_INPUTS[source](day):
+                inputs.setdefault(path, set()).add(source)
+    return inputs
+
+
+def input_snapshot(paths):
+    snapshot = {}
+    for path in paths:
+        try:
+            snapshot[path] = file_fingerprint(path)
+        except FileNotFoundError:
+            pass
+    return snapshot
+
+
+def watch(
+    start_date=DEFAULT_BUSINESS_DATE,
+    end_date=DEFAULT_BUSINESS_DATE,
+    poll_seconds=WATCH_POLL_SECONDS,
+    max_workers=None,
+    formats=("csv",),
+    chart=True,
+    engine=ENGINE,
+):
+    # The master lookups stay in this process and the per-source totals stay in
+    # the cube, so a landed file only refetches the partitions it feeds.
+    load_master_data()
+    # Passed by name so every reconcile option reaches both calls.
+    options = {
+        "max_workers": max_workers,
+        "headless": True,
+        "formats": formats,
+        "chart": chart,
+        "engine": engine,
+    }
+    generate_csv(start_date, end_date, **options)
+    db_refreshed_at = time.monotonic()
+    inputs = watched_inputs(start_date, end_date)
+    snapshot = input_snapshot(inputs)
+    pending = {}
+
+    while True:
+        time.sleep(poll_seconds)
+        inputs = watched_inputs(start_date, end_date)
+        current = input_snapshot(inputs)
+
+        # A file is only picked up once it stops changing between two polls,
+        # so half-copied downloads are never parsed.
+        settled = [
+            path
+            for path, fingerprint in current.items()
+            if fingerprint != snapshot.get(path) and pending.get(path) == fingerprint
+        ]
+        pending = {
+            path: fingerprint
+            for path, fingerprint in current.items()
+            if fingerprint != snapshot.get(path) and path not in settled
+        }
+
+        db_due = (
+            business_date(end_date) >= pd.Timestamp.today().normalize()
+            and time.monotonic() - db_refreshed_at >= WATCH_DB_REFRESH_SECONDS
+        )
+        if not settled and not db_due:
+            continue
+
+        # Every file source is offered, so stale_partitions also retries the
+        # ones that failed earlier; only the Oracle pull is throttled, since
+        # its open days are always stale.
+        changed = {source for path in settled for source in inputs[path]}
+        if db_due:
+            changed.update(DB_SOURCES)
+        sources = changed | set(PARSE_SOURCES)
+
+        send_message(
+            {
+                "severity": "info",
+                "event": "inputs_changed",
+                "paths": sorted(settled),
+                "sources": sorted(changed),
+            }
+        )
+        if MASTER_FILE_PATH in settled:
+            # check_format exits on a bad header; the daemon must outlive it.
+            try:
+                reload_master_data()
+            except (Exception, SystemExit) as e:
+                # A SystemExit has already reported its reason.
+                reason = "see above" if isinstance(e, SystemExit) else e
+                send_message(
+                    {
+                        "severity": "error",
+                        "message": f"Could not reload MASTER FILE FOR COLLECTION_VOL-2, keeping the previous sheets until it is fixed: {reason}",
+                    }
+                )
+                # Nothing is snapshotted, so every settled file comes round
+                # again and the cube is not keyed on a master never loaded.
+                continue
+        if db_due:
+            db_refreshed_at = time.monotonic()
+
+        generate_csv(start_date, end_date, sources=sorted(sources), **options)
+        for path in settled:
+            snapshot[path] = current[path]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Reconcile Ginesys credit card sales against acquirer MPRs."
+    )
+    parser.add_argument(
+        "--from",
+        dest="start_date",
+        type=business_date,
+        default=business_date(DEFAULT_BUSINESS_DATE),
+        help="First business date to reconcile (YYYY-MM-DD).",
     )
+    parser.add_argument(
+        "--to",
+        dest="end_date",
+        type=business_date,
+        help="Last business date to reconcile (YYYY-MM-DD), defaults to --from.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Worker processes for file parsing, defaults to one per source.",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Recompute every source partition in the range instead of reusing the cube.",
+    )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Write the difference chart without opening it in a browser.",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default=ENGINE,
+        help="DataFrame engine for the raw file scans (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--format",
+        dest="formats",
+        action="append",
+        choices=list(OUTPUT_FORMATS),
+        help="Output format, repeat for several (default: csv).",
+    )
+    parser.add_argument(
+        "--no-chart",
+        dest="chart",
+        action="store_false",
+        help="Skip the difference bar chart.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and reconcile again whenever an input file lands or changes.",
+    )
+    parser.add_argument(
+        "--poll-seconds",
+        type=float,
+        default=WATCH_POLL_SECONDS,
+        help="How often --watch checks the input directory.",
+    )
+    parser.add_argument(
+        "--match",
+        action="store_true",
+        help="Also match POS bill lines against acquirer transactions and write exception tables.",
+    )
+    parser.add_argument(
+        "--match-tolerance",
+        type=float,
+        default=MATCH_TOLERANCE_MINUTES,
+        help="Minutes a POS bill and an acquirer transaction may be apart and still match.",
+    )
+    commands = parser.add_subparsers(dest="command")
+    drilldown_parser = commands.add_parser(
+        "drilldown",
+        help="Show the terminal-level rows behind one store's reconciled day.",
+    )
+    drilldown_parser.add_argument("store", help="Store name, in any source's spelling.")
+    drilldown_parser.add_argument(
+        "day", type=business_date, help="Business date (YYYY-MM-DD)."
+    )
+    trends_parser = commands.add_parser(
+        "trends",
+        help="Rolling Difference statistics, non-zero streaks and anomalies from the history.",
+    )
+    trends_parser.add_argument(
+        "--window",
+        type=int,
+        default=HISTORY_WINDOW_DAYS,
+        help="Rolling window in days (default: %(default)s).",
+    )
+    trends_parser.add_argument(
+        "--z",
+        dest="z_threshold",
+        type=float,
+        default=ANOMALY_Z_SCORE,
+        help="Flag days whose Difference z-score is at least this (default: %(default)s).",
+    )
+    commands.add_parser(
+        "preflight",
+        help="Only check that every input for --from/--to is present and readable.",
+    )
+    commands.add_parser(
+        "cache-stats", help="Show hit/miss counts and size of the fetcher cache."
+    )
+    args = parser.parse_args(argv)
+    if args.end_date is None:
+        args.end_date = args.start_date
+    if args.formats is None:
+        args.formats = ["csv"]
+    if args.end_date < args.start_date:
+        parser.error("--to must not be before --from")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "drilldown":
+        detail = drilldown(args.store, args.day)
+        if detail.empty:
+            send_message(
+                {
+                    "severity": "warning",
+                    "message": f"No terminal rows for {args.store} on {args.day:%Y-%m-%d}; reconcile that day first.",
+                }
+            )
+            return 1
+        send_message(
+            {
+                "severity": "info",
+                "event": "drilldown",
+                "store": args.store,
+                "date": f"{args.day:%Y-%m-%d}",
+                "rows": json.loads(detail.to_json(orient="records")),
+            }
+        )
+        return 0
+
+    if args.command == "trends":
+        history = load_history(args.start_date, args.end_date)
+        if history.empty:
+            send_message(
+                {
+                    "severity": "warning",
+                    "message": "No reconciliation history in that range; run it first.",
+                }
+            )
+            return 1
+        trends = difference_trends(history, args.window, args.z_threshold)
+        paths = write_table(
+            trends.assign(DATE=trends["DATE"].dt.strftime("%Y-%m-%d")),
+            output_dir(args.start_date, args.end_date),
+            TRENDS_NAME,
+            args.formats,
+        )
+        anomalies = trends[trends["ANOMALY"]]
+        latest = trends.drop_duplicates("STORE", keep="last")
+        send_message(
+            {
+                "severity": "info",
+                "event": "trends",
+                "paths": paths,
+                "anomalies": json.loads(
+                    anomalies[["STORE", "DATE", "Difference"]].to_json(
+                        orient="records", date_format="iso"
+                    )
+                ),
+                "open_streaks": latest.loc[
+                    latest["NONZERO_STREAK"] > 0, ["STORE", "NONZERO_STREAK"]
+                ].to_dict(orient="records"),
+            }
+        )
+        return 0
+
+    if args.command == "preflight":
+        windows = dict.fromkeys(SOURCE_COLUMNS, (args.start_date, args.end_date))
+        problems = preflight(windows)
+        return 1 if any(p["severity"] == "error" for p in problems) else 0
+
+    if args.command == "cache-stats":
+        send_message(
+            {
+                "severity": "info",
+                "event": "fetch_cache",
+                "max_bytes": FETCH_CACHE_MAX_BYTES,
+                "sources": fetch_cache_stats().to_dict(orient="records"),
+            }
+        )
+        return 0
+
+    if args.watch:
+        try:
+            watch(
+                args.start_date,
+                args.end_date,
+                args.poll_seconds,
+                args.workers,
+                args.formats,
+                args.chart,
+                args.engine,
+            )
+        except KeyboardInterrupt:
+            return 0
+        finally:
+            close_session_pool()
+
+    try:
+        merged_data = generate_csv(
+            args.start_date,
+            args.end_date,
+            args.workers,
+            args.refresh,
+            args.headless,
+            args.formats,
+            args.chart,
+            args.engine,
+        )
+        matched = True
+        if args.match:
+            matched = (
+                match_range(
+                    args.start_date, args.end_date, args.match_tolerance, args.formats
+                )
+                is not None
+            )
+    finally:
+        close_session_pool()
+    return 0 if merged_data is not None and matched else 1
 
 
-generate_csv()
+if __name__ == "__main__":
+    sys.exit(main())
 
 
 # def fetch_ginesys_advance():
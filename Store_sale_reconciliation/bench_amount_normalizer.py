@@ -0,0 +1,75 @@
+import argparse
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from Ginesys_MPR_Automation import normalize_amount
+
+
+def legacy_paytm_amount(values):
+    values = values.str.replace("'", "")
+    return values.apply(lambda x: sum(map(float, re.findall(r"\d+\.\d+", str(x)))))
+
+
+AMOUNT_FORMATS = {
+    "plain": lambda first, second: f"{first:.2f}",
+    "quoted": lambda first, second: f"'{first:.2f}'",
+    "multi": lambda first, second: f"'{first:.2f}, {second:.2f}'",
+    "grouped": lambda first, second: f"{first * 100:,.2f}",
+    "refund": lambda first, second: f"'-{first:.2f}'",
+}
+
+
+def write_synthetic_amounts(path, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    first = rng.integers(100, 99_999, rows) / 100
+    second = rng.integers(100, 9_999, rows) / 100
+    kinds = rng.choice(list(AMOUNT_FORMATS), rows, p=[0.44, 0.44, 0.05, 0.05, 0.02])
+    amounts = [
+        AMOUNT_FORMATS[kind](a, b) for kind, a, b in zip(kinds, first, second)
+    ]
+    pd.DataFrame({"amount": amounts, "format": kinds}).to_csv(path, index=False)
+
+
+def time_call(func, values):
+    start = time.perf_counter()
+    result = func(values)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the legacy Paytm amount lambda with normalize_amount."
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "amounts.csv")
+        write_synthetic_amounts(path, args.rows)
+        frame = pd.read_csv(path, dtype=str)
+
+    legacy, legacy_seconds = time_call(legacy_paytm_amount, frame["amount"])
+    vectorized, vectorized_seconds = time_call(normalize_amount, frame["amount"])
+
+    # The legacy regex cannot read thousand separators, so compare the rest.
+    # It also drops the minus of refunds, which normalize_amount keeps.
+    comparable = ~frame["format"].isin(["grouped", "refund"])
+    mismatches = (~np.isclose(legacy[comparable], vectorized[comparable])).sum()
+    refunds = frame["format"] == "refund"
+    flipped = np.isclose(legacy[refunds], -vectorized[refunds]).sum()
+
+    print(f"rows:            {args.rows:,}")
+    print(f"legacy lambda:   {legacy_seconds:.3f}s")
+    print(f"normalize_amount:{vectorized_seconds:.3f}s")
+    print(f"speedup:         {legacy_seconds / vectorized_seconds:.1f}x")
+    print(f"mismatches:      {mismatches} of {comparable.sum():,} comparable rows")
+    print(f"refunds:         {flipped} of {refunds.sum():,} read as -legacy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+
+MASTER_SHEET_COUNT = 15
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Time and memory-profile the reconciliation on synthetic inputs."
+    )
+    parser.add_argument("--stores", type=int, default=200)
+    parser.add_argument(
+        "--terminals", type=int, default=3, help="Terminals per store per acquirer."
+    )
+    parser.add_argument(
+        "--transactions",
+        type=int,
+        default=40,
+        help="Transactions per terminal per day.",
+    )
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--start", default="2023-12-28")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--workdir", help="Keep the generated inputs here instead of a temp dir."
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="Skip the tracemalloc pass."
+    )
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    return parser.parse_args()
+
+
+def build_dimensions(args):
+    stores = pd.DataFrame(
+        {
+            "CODE": np.arange(1, args.stores + 1),
+            "SHRTNAME": [f"STORE {code:04d}" for code in range(1, args.stores + 1)],
+        }
+    )
+    terminals = stores.loc[stores.index.repeat(args.terminals)].reset_index(drop=True)
+    terminals["SBI_TID"] = [f"{70_000_000 + i}" for i in range(len(terminals))]
+    terminals["HDFC_TID"] = [f"{80_000_000 + i}" for i in range(len(terminals))]
+    terminals["PAYTM_MID"] = [f"VMART{i:010d}" for i in range(len(terminals))]
+    stores["BFL_DEALER"] = 100_000 + stores["CODE"]
+    return stores, terminals
+
+
+def build_transactions(rng, args, terminals, terminal_column):
+    days = pd.date_range(args.start, periods=args.days, freq="D")
+    per_day = len(terminals) * args.transactions
+    rows = per_day * len(days)
+
+    picks = np.tile(np.repeat(terminals.index.to_numpy(), args.transactions), len(days))
+    day_offsets = np.repeat(days.to_numpy(), per_day)
+    seconds = rng.integers(9 * 3600, 22 * 3600, rows).astype("timedelta64[s]")
+    return pd.DataFrame(
+        {
+            "CODE": terminals["CODE"].to_numpy()[picks],
+            "TERMINAL": terminals[terminal_column].to_numpy()[picks],
+            "TIME": day_offsets + seconds,
+            # Amounts with paise: the pipeline sums int64 paise, so the synthetic
+            # data must still reconcile to an exactly zero Difference.
+            "AMOUNT": rng.integers(100_00, 20_000_00, rows) / 100,
+        }
+    )
+
+
+def write_master(path, stores, terminals):
+    sheets = {
+        4: pd.DataFrame(
+            {
+                "HDFC TID": terminals["HDFC_TID"].astype(int),
+                "Store Locations": terminals["SHRTNAME"],
+            }
+        ),
+        11: pd.DataFrame(
+            {
+                "TID": terminals["SBI_TID"].astype(int),
+                "LOCATION NAME": terminals["SHRTNAME"],
+            }
+        ),
+        14: pd.DataFrame(
+            {"BFL\nDEALER CODE": stores["BFL_DEALER"], "Store name": stores["SHRTNAME"]}
+        ),
+    }
+    paytm_sheet = pd.DataFrame(
+        {"Production Mid": terminals["PAYTM_MID"], "LOCATION": terminals["SHRTNAME"]}
+    )
+
+    # pandas picks the Excel reader from the file contents, so an .xlsx workbook
+    # renamed to the .xlsb master path is read just the same.
+    xlsx_path = f"{path}.xlsx"
+    with pd.ExcelWriter(xlsx_path, engine="openpyxl") as writer:
+        for index in range(MASTER_SHEET_COUNT):
+            sheet_name = f"Sheet{index}"
+            if index == 3:
+                pd.DataFrame([["PAYTM MID MASTER"]]).to_excel(
+                    writer, sheet_name=sheet_name, index=False, header=False
+                )
+                paytm_sheet.to_excel(
+                    writer, sheet_name=sheet_name, index=False, startrow=1
+                )
+            else:
+                sheets.get(index, pd.DataFrame({"UNUSED": [0]})).to_excel(
+                    writer, sheet_name=sheet_name, index=False
+                )
+    os.replace(xlsx_path, path)
+
+
+def generate_inputs(mpr, args, workdir):
+    rng = np.random.default_rng(args.seed)
+    stores, terminals = build_dimensions(args)
+    write_master(mpr.MASTER_FILE_PATH, stores, terminals)
+
+    sbi = build_transactions(rng, args, terminals, "SBI_TID")
+    pd.DataFrame(
+        {
+            "TID": "'" + sbi["TERMINAL"],
+            "Tran Date": sbi["TIME"].dt.strftime("%Y-%m-%d %H:%M:%S"),
+            "Net Amount": sbi["AMOUNT"],
+            "Card Type": "VISA",
+        }
+    ).to_csv(mpr.SBI_CSV_PATH, index=False)
+
+    hdfc = build_transactions(rng, args, terminals, "HDFC_TID")
+    for day, frame in hdfc.groupby(hdfc["TIME"].dt.normalize()):
+        # fetch_hdfc reads the settlement as tab separated text.
+        pd.DataFrame(
+            {
+                "TERMINAL NUMBER": frame["TERMINAL"].astype(int),
+                "DOMESTIC AMT": frame["AMOUNT"],
+                "INTNL AMT": 0.0,
+            }
+        ).to_csv(mpr.hdfc_file_path(day), sep="\t", index=False)
+
+    paytm = build_transactions(rng, args, terminals, "PAYTM_MID")
+    pd.DataFrame(
+        {
+            "original_mid": "'" + paytm["TERMINAL"],
+            "transaction_date": "'" + paytm["TIME"].dt.strftime("%d-%m-%Y %H:%M:%S"),
+            "amount": "'" + paytm["AMOUNT"].map("{:.2f}".format),
+            "status": "SUCCESS",
+        }
+    ).to_csv(mpr.PAYTM_CSV_PATH, index=False, encoding="ISO-8859-1")
+
+    dealers = stores.rename(columns={"BFL_DEALER": "TERMINAL"})
+    bajaj = build_transactions(rng, args, dealers, "TERMINAL")
+    pd.DataFrame(
+        {
+            "Supplier ID": bajaj["TERMINAL"],
+            "Invoice Date": "'" + bajaj["TIME"].dt.strftime("%d/%m/%Y"),
+            "Invoice Amt": bajaj["AMOUNT"],
+        }
+    ).to_excel(mpr.BAJAJ_LEDGER_PATH, index=False)
+
+    for day in pd.date_range(args.start, periods=args.days, freq="D"):
+        new_mop = pd.DataFrame(
+            {
+                "Ledger": "Credit Card Receivable",
+                "Entry type long": "POS Journal",
+                "Source Short Name": stores["SHRTNAME"],
+                "Balance SUM": 0.0,
+            }
+        )
+        with open(mpr.new_mop_file_path(day), "w", encoding="ISO-8859-1") as handle:
+            handle.write("NEW MOP (Finance)\n")
+            new_mop.to_csv(handle, index=False)
+
+    sbi["MOPDESC"] = hdfc["MOPDESC"] = bajaj["MOPDESC"] = "Credit Card"
+    paytm["MOPDESC"] = "Paytm_EDC_1"
+    write_ginesys_stand_in(
+        os.path.join(workdir, "ginesys.sqlite"), stores, [sbi, hdfc, paytm, bajaj]
+    )
+
+
+def write_ginesys_stand_in(path, stores, acquirer_frames):
+    bills = pd.concat(acquirer_frames, ignore_index=True)
+    with sqlite3.connect(path) as connection:
+        stores[["CODE", "SHRTNAME"]].to_sql(
+            "ADMSITE", connection, index=False, if_exists="replace"
+        )
+        pd.DataFrame(
+            {
+                "ADMSITE_CODE": bills["CODE"],
+                "MOPDESC": bills["MOPDESC"],
+                "BILLDATE": bills["TIME"].dt.strftime("%Y-%m-%d %H:%M:%S"),
+                "BASEAMT": bills["AMOUNT"],
+            }
+        ).to_sql("PSITE_POSBILLMOP", connection, index=False, if_exists="replace")
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS POSBILLMOP_BILLDATE ON PSITE_POSBILLMOP (BILLDATE)"
+        )
+
+
+def measure(func, *args, memory=True):
+    started = time.perf_counter()
+    result = func(*args)
+    wall_time = time.perf_counter() - started
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        func(*args)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result, wall_time, peak_mb
+
+
+def run_benchmark(mpr, args):
+    start_date = mpr.business_date(args.start)
+    end_date = start_date + pd.Timedelta(days=args.days - 1)
+    memory = not args.no_memory
+    results = []
+    parity_failures = []
+
+    def record(stage, wall_time, peak_mb, rows=None):
+        results.append(
+            {"stage": stage, "wall_time_s": wall_time, "peak_mb": peak_mb, "rows": rows}
+        )
+
+    def load_master_cold():
+        shutil.rmtree(mpr.MASTER_CACHE_DIR, ignore_errors=True)
+        mpr._master_data = None
+        return mpr.load_master_data()
+
+    def load_master_cached():
+        mpr._master_data = None
+        return mpr.load_master_data()
+
+    _, wall_time, peak_mb = measure(load_master_cold, memory=memory)
+    record("master (parse workbook)", wall_time, peak_mb)
+    _, wall_time, peak_mb = measure(load_master_cached, memory=memory)
+    record("master (parquet cache)", wall_time, peak_mb)
+
+    for name, fetcher in {**mpr.PARSE_SOURCES, **mpr.DB_SOURCES}.items():
+        frame, wall_time, peak_mb = measure(
+            fetcher, start_date, end_date, memory=memory
+        )
+        record(name, wall_time, peak_mb, None if frame is None else len(frame))
+
+        if name in mpr.ENGINE_SOURCES and importlib.util.find_spec("polars"):
+            lazy_frame, wall_time, peak_mb = measure(
+                fetcher, start_date, end_date, "polars", memory=memory
+            )
+            record(f"{name} (polars)", wall_time, peak_mb, len(lazy_frame))
+            parity_failures.extend(engine_mismatches(name, frame, lazy_frame))
+
+    def full_run():
+        mpr.generate_csv(start_date, end_date, refresh=True, headless=True)
+
+    def incremental_run():
+        mpr.generate_csv(start_date, end_date, headless=True)
+
+    _, wall_time, _ = measure(full_run, memory=False)
+    record("generate_csv (full)", wall_time, None)
+    _, wall_time, _ = measure(incremental_run, memory=False)
+    record("generate_csv (cube hit)", wall_time, None)
+    # Rebuilds every partition, but the fetchers are served from the memo.
+    _, wall_time, _ = measure(full_run, memory=False)
+    record("generate_csv (fetch cache hit)", wall_time, None)
+
+    matches, wall_time, _ = measure(
+        mpr.match_range, start_date, end_date, memory=False
+    )
+    record("match transactions", wall_time, None, len(matches["matched"]))
+
+    # A year of history for every store, written before the benchmark days.
+    rng = np.random.default_rng(args.seed)
+    history = pd.MultiIndex.from_product(
+        [
+            [f"STORE {code:04d}" for code in range(1, args.stores + 1)],
+            pd.date_range(end=start_date - pd.Timedelta(days=1), periods=365),
+        ],
+        names=["STORE", "DATE"],
+    ).to_frame(index=False)
+    for column in [*mpr.SOURCE_COLUMNS.values(), "total_CC_recd"]:
+        history[column] = 0
+    history["Difference"] = np.where(
+        rng.random(len(history)) < 0.1, rng.integers(-500_00, 500_00, len(history)), 0
+    )
+    mpr.append_history(history)
+
+    def year_of_trends():
+        return mpr.difference_trends(
+            mpr.load_history(history["DATE"].min(), history["DATE"].max())
+        )
+
+    trends, wall_time, _ = measure(year_of_trends, memory=False)
+    record("difference trends (1 year)", wall_time, None, len(trends))
+
+    children_peak_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    record("worker processes (max RSS)", None, children_peak_mb)
+    return results, parity_failures
+
+
+def engine_mismatches(name, expected, actual):
+    # The Polars scans must reproduce the pandas totals store for store.
+    keys = ["STORE", "DATE"]
+    expected = expected.sort_values(keys, ignore_index=True)
+    actual = actual.sort_values(keys, ignore_index=True)
+    try:
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+    except AssertionError as e:
+        return [f"{name}: {e}"]
+    return []
+
+
+def print_results(args, results):
+    print(
+        f"\n{args.stores} stores x {args.terminals} terminals x "
+        f"{args.transactions} transactions/day x {args.days} day(s)"
+    )
+    print(f"{'stage':<30}{'wall s':>10}{'peak MB':>10}{'rows':>10}")
+    for row in results:
+        wall_time = "" if row["wall_time_s"] is None else f"{row['wall_time_s']:.3f}"
+        peak_mb = "" if row["peak_mb"] is None else f"{row['peak_mb']:.1f}"
+        rows = "" if row["rows"] is None else f"{row['rows']:,}"
+        print(f"{row['stage']:<30}{wall_time:>10}{peak_mb:>10}{rows:>10}")
+
+
+def main():
+    args = parse_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="recon_bench_")
+    os.makedirs(workdir, exist_ok=True)
+
+    # The pipeline reads its locations from the environment at import time.
+    os.environ["RECON_INPUT_DIR"] = workdir
+    os.environ["GINESYS_SQLITE_PATH"] = os.path.join(workdir, "ginesys.sqlite")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    mpr = importlib.import_module("Ginesys_MPR_Automation")
+
+    try:
+        started = time.perf_counter()
+        generate_inputs(mpr, args, workdir)
+        print(f"generated inputs in {time.perf_counter() - started:.1f}s: {workdir}")
+
+        results, parity_failures = run_benchmark(mpr, args)
+        print_results(args, results)
+        for failure in parity_failures:
+            print(f"engine parity mismatch in {failure}")
+        if args.json:
+            with open(args.json, "w") as handle:
+                json.dump({"args": vars(args), "results": results}, handle, indent=2)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if parity_failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import importlib
+import os
+import sys
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from benchmark_reconciliation import build_dimensions, write_master
+
+pytest.importorskip("polars")
+
+START, END = "2023-12-28", "2023-12-29"
+
+# Every amount shape the acquirer exports use, as (cell, paise).
+AMOUNTS = [
+    ("250", 250_00),
+    ("'100.00'", 100_00),
+    ("'100.00, 20.50'", 120_50),
+    ("1,234.50", 1_234_50),
+    ("-75.25", -75_25),
+    ("'-10.00, 4.00'", -6_00),
+    ("", 0),
+]
+
+
+@pytest.fixture(scope="module")
+def mpr(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("inputs")
+    patch = pytest.MonkeyPatch()
+    # The pipeline reads its locations from the environment at import time.
+    patch.setenv("RECON_INPUT_DIR", str(workdir))
+    patch.setenv("RECON_FETCH_CACHE_MB", "0")
+    sys.modules.pop("Ginesys_MPR_Automation", None)
+    module = importlib.import_module("Ginesys_MPR_Automation")
+    write_inputs(module)
+    yield module
+    patch.undo()
+    sys.modules.pop("Ginesys_MPR_Automation", None)
+
+
+def synthetic_rows(terminals, column):
+    days = pd.to_datetime([START, END, "2023-12-30"])
+    rows = [
+        (terminal, day + pd.Timedelta(hours=10, minutes=index), cell)
+        for day in days
+        for terminal in terminals[column]
+        for index, (cell, _) in enumerate(AMOUNTS)
+    ]
+    return pd.DataFrame(rows, columns=["TERMINAL", "TIME", "AMOUNT"])
+
+
+def write_inputs(mpr):
+    stores, terminals = build_dimensions(SimpleNamespace(stores=3, terminals=2))
+    write_master(mpr.MASTER_FILE_PATH, stores, terminals)
+
+    sbi = synthetic_rows(terminals, "SBI_TID")
+    pd.DataFrame(
+        {
+            "TID": "'" + sbi["TERMINAL"],
+            "Tran Date": sbi["TIME"].dt.strftime("%Y-%m-%d %H:%M:%S"),
+            "Net Amount": sbi["AMOUNT"],
+        }
+    ).to_csv(mpr.SBI_CSV_PATH, index=False)
+
+    paytm = synthetic_rows(terminals, "PAYTM_MID")
+    # A Latin-1 column next to the ASCII ones the scans read.
+    pd.DataFrame(
+        {
+            "original_mid": "'" + paytm["TERMINAL"],
+            "transaction_date": "'"
+            + paytm["TIME"].dt.strftime(mpr.PAYTM_TIME_FORMAT),
+            "amount": paytm["AMOUNT"],
+            "merchant": "Café Müller",
+        }
+    ).to_csv(mpr.PAYTM_CSV_PATH, index=False, encoding="ISO-8859-1")
+
+    hdfc = synthetic_rows(terminals, "HDFC_TID")
+    for day, rows in hdfc.groupby(hdfc["TIME"].dt.normalize()):
+        settlement = pd.DataFrame(
+            {
+                "TERMINAL NUMBER": rows["TERMINAL"],
+                "DOMESTIC AMT": rows["AMOUNT"],
+                "INTNL AMT": rows["AMOUNT"].iloc[::-1].to_numpy(),
+            }
+        )
+        path = mpr.hdfc_file_path(day)
+        if day == pd.Timestamp(START):
+            settlement.to_csv(path, sep="\t", index=False)
+        else:
+            # An .xlsb name over xlsx content, as the settlements arrive.
+            settlement.to_excel(f"{path}.xlsx", index=False)
+            os.replace(f"{path}.xlsx", path)
+
+
+def sorted_frame(frame, keys):
+    return frame.sort_values(keys, ignore_index=True)
+
+
+@pytest.mark.parametrize(
+    "fetcher, amount_column",
+    [
+        ("fetch_sbi_data", "SBI_total_amt"),
+        ("fetch_hdfc", "hdfc_total_amt"),
+        ("paytm_mpr", "Paytm_total_amt"),
+    ],
+)
+def test_polars_matches_pandas(mpr, fetcher, amount_column):
+    fetch = getattr(mpr, fetcher)
+    expected = fetch(START, END, "pandas")
+    actual = fetch(START, END, "polars")
+
+    assert expected[amount_column].sum() != 0
+    pd.testing.assert_frame_equal(
+        sorted_frame(expected, ["STORE", "DATE"]),
+        sorted_frame(actual, ["STORE", "DATE"]),
+        check_dtype=False,
+    )
+    pd.testing.assert_frame_equal(
+        sorted_frame(expected.attrs["terminals"], ["STORE", "DATE", "TERMINAL"]),
+        sorted_frame(actual.attrs["terminals"], ["STORE", "DATE", "TERMINAL"]),
+        check_dtype=False,
+    )
+
+
+def test_amount_shapes(mpr):
+    cells = pd.Series([cell for cell, _ in AMOUNTS])
+    paise = [amount for _, amount in AMOUNTS]
+    assert mpr.to_paise(mpr.normalize_amount(cells)).tolist() == paise
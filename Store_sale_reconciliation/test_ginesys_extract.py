@@ -0,0 +1,111 @@
+import importlib
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark_reconciliation import (
+    build_dimensions,
+    build_transactions,
+    write_ginesys_stand_in,
+)
+
+pytest.importorskip("pyarrow")
+
+COLUMNS = ["STORE", "DATE", "TERMINAL", "AMOUNT", "max_BILLDATE", "ROWS"]
+KEYS = ["STORE", "DATE", "TERMINAL"]
+
+
+@pytest.fixture(scope="module")
+def mpr(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("ginesys")
+    patch = pytest.MonkeyPatch()
+    # The stand-in is chosen at import time, as in the benchmark.
+    patch.setenv("RECON_INPUT_DIR", str(workdir))
+    patch.setenv("GINESYS_SQLITE_PATH", str(workdir / "ginesys.sqlite"))
+    patch.setenv("RECON_FETCH_CACHE_MB", "0")
+    sys.modules.pop("Ginesys_MPR_Automation", None)
+    module = importlib.import_module("Ginesys_MPR_Automation")
+
+    args = SimpleNamespace(stores=3, terminals=2, transactions=4)
+    args.start, args.days = "2023-12-18", 21
+    stores, terminals = build_dimensions(args)
+    rng = np.random.default_rng(0)
+    bills = [
+        build_transactions(rng, args, terminals, "SBI_TID").assign(
+            MOPDESC="Credit Card"
+        ),
+        build_transactions(rng, args, terminals, "PAYTM_MID").assign(
+            MOPDESC="Paytm_EDC_1"
+        ),
+    ]
+    write_ginesys_stand_in(module.GINESYS_SQLITE_PATH, stores, bills)
+    yield module
+    patch.undo()
+    sys.modules.pop("Ginesys_MPR_Automation", None)
+
+
+def pull(mpr, start_date, end_date):
+    frame = mpr.extract_ginesys(mpr.GINESYS_ADVANCE_SQL, COLUMNS, start_date, end_date)
+    return frame.sort_values(KEYS, ignore_index=True)
+
+
+def single_window(mpr, monkeypatch, tmp_path, start_date, end_date):
+    monkeypatch.setattr(mpr, "GINESYS_CHECKPOINT_DIR", str(tmp_path / "single"))
+    monkeypatch.setattr(mpr, "GINESYS_CHUNK_DAYS", 100_000)
+    return pull(mpr, start_date, end_date)
+
+
+def interrupted(mpr, monkeypatch, fail_on, start_date, end_date):
+    fetch_arrow = mpr._fetch_arrow
+    calls = []
+
+    def flaky_fetch_arrow(cursor, columns):
+        calls.append(columns)
+        if len(calls) == fail_on:
+            raise ConnectionError("ORA-03113: end-of-file on communication channel")
+        return fetch_arrow(cursor, columns)
+
+    monkeypatch.setattr(mpr, "_fetch_arrow", flaky_fetch_arrow)
+    with pytest.raises(ConnectionError):
+        pull(mpr, start_date, end_date)
+    monkeypatch.setattr(mpr, "_fetch_arrow", fetch_arrow)
+
+
+def resumed_pull(mpr, monkeypatch, start_date, end_date):
+    events = []
+    monkeypatch.setattr(mpr, "send_message", events.append)
+    frame = pull(mpr, start_date, end_date)
+    (extract,) = [event for event in events if event.get("event") == "extract"]
+    return frame, extract
+
+
+def test_interrupted_pull_resumes(mpr, monkeypatch, tmp_path):
+    start_date, end_date = "2023-12-28", "2023-12-30"
+    expected = single_window(mpr, monkeypatch, tmp_path, start_date, end_date)
+
+    monkeypatch.setattr(mpr, "GINESYS_CHECKPOINT_DIR", str(tmp_path / "daily"))
+    monkeypatch.setattr(mpr, "GINESYS_CHUNK_DAYS", 1)
+    interrupted(mpr, monkeypatch, 2, start_date, end_date)
+    frame, extract = resumed_pull(mpr, monkeypatch, start_date, end_date)
+
+    assert extract["chunks"] == 3
+    assert extract["resumed"] >= 1
+    assert not expected.empty
+    pd.testing.assert_frame_equal(frame, expected, check_dtype=False)
+
+
+def test_resume_with_another_from(mpr, monkeypatch, tmp_path):
+    # Weekly windows start on Mondays; 2023-12-25..31 is one whatever --from.
+    expected = single_window(mpr, monkeypatch, tmp_path, "2023-12-25", "2024-01-07")
+
+    monkeypatch.setattr(mpr, "GINESYS_CHECKPOINT_DIR", str(tmp_path / "weekly"))
+    monkeypatch.setattr(mpr, "GINESYS_CHUNK_DAYS", 7)
+    interrupted(mpr, monkeypatch, 3, "2023-12-20", "2024-01-07")
+    frame, extract = resumed_pull(mpr, monkeypatch, "2023-12-25", "2024-01-07")
+
+    assert extract["chunks"] == 2
+    assert extract["resumed"] == 1
+    pd.testing.assert_frame_equal(frame, expected, check_dtype=False)